@@ -0,0 +1,36 @@
+"""Reproducible synthetic ledgers, loaded through the bulk importer"""
+import datetime
+import random
+
+from strichliste import importer
+
+START = datetime.datetime(2020, 1, 1)
+
+
+def generate_users(users):
+    for x in range(1, users + 1):
+        yield {'id': x, 'name': 'user{}'.format(x), 'mailAddress': 'user{}@example.org'.format(x),
+               'createDate': START, 'active': 1}
+
+
+def generate_transactions(users, transactions, days, seed=0):
+    """Spread transactions over days in time order, a few heavy users make most of them like on a real list
+
+    :return: Generator of transaction dicts with ids starting at 1
+    """
+    rng = random.Random(seed)
+    weights = [1 / x for x in range(1, users + 1)]
+    step = days * 86400 / max(transactions, 1)
+    for x in range(1, transactions + 1):
+        user_id = rng.choices(range(1, users + 1), weights)[0]
+        value = rng.choice((-50, -100, -150, -200, -250)) if rng.random() < 0.9 else rng.choice((1000, 2000, 5000))
+        yield {'id': x, 'userId': user_id, 'value': value,
+               'createDate': START + datetime.timedelta(seconds=int(x * step))}
+
+
+def seed_ledger(users, transactions, days, seed=0):
+    """Import a synthetic ledger into the current app's empty database
+
+    :return: (user count, transaction count, seconds)
+    """
+    return importer.import_ledger(generate_users(users), generate_transactions(users, transactions, days, seed))
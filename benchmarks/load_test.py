@@ -0,0 +1,114 @@
+"""Load test the REST API over HTTP, optionally comparing the WSGI dev server against the ASGI server
+
+Usage: python -m benchmarks.load_test --compare
+       python -m benchmarks.load_test --url http://127.0.0.1:8080/
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from benchmarks.sqlite_profile import PROFILES, bench_config
+
+USERS = 20
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def seed(url):
+    for x in range(USERS):
+        requests.post(url + 'user', json={'name': 'load{}'.format(x), 'mailAddress': ''})
+
+
+def run_load(url, concurrency, count, write_ratio):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(offset):
+        session = requests.Session()
+        for x in range(offset, count, concurrency):
+            user_id = x % USERS + 1
+            start = time.perf_counter()
+            if x % 100 < write_ratio * 100:
+                r = session.post('{}user/{}/transaction'.format(url, user_id), json={'value': 100})
+            else:
+                r = session.get('{}user/{}'.format(url, user_id))
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if r.status_code >= 400:
+                    errors.append(r.status_code)
+
+    threads = [threading.Thread(target=worker, args=(x,)) for x in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    return {'requests': len(latencies), 'errors': len(errors),
+            'requestsPerSecond': round(len(latencies) / duration, 1),
+            'p50Ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95Ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99Ms': round(percentile(latencies, 0.99) * 1000, 2)}
+
+
+def wait_ready(url, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url + 'settings')
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError("server at {} did not come up".format(url))
+
+
+def compare(args):
+    results = {}
+    for name, port, extra in (('wsgi', 8181, []), ('asgi', 8182, ['--asgi'])):
+        config_path = bench_config(PROFILES['high-throughput'], server={'port': port})
+        # WERKZEUG_RUN_MAIN keeps the debug reloader from forking a child that would outlive terminate()
+        server = subprocess.Popen([sys.executable, 'strichliste.py', '-c', config_path, 'serve'] + extra,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                  env=dict(os.environ, WERKZEUG_RUN_MAIN='true'))
+        try:
+            url = 'http://127.0.0.1:{}/'.format(port)
+            wait_ready(url)
+            seed(url)
+            results[name] = run_load(url, args.concurrency, args.requests, args.write_ratio)
+        finally:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default=None, help='running server to test, seeded with {} users'.format(USERS))
+    parser.add_argument('--compare', action='store_true', help='start and test both servers')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    args = parser.parse_args()
+    if args.compare:
+        results = compare(args)
+    elif args.url:
+        seed(args.url)
+        results = run_load(args.url, args.concurrency, args.requests, args.write_ratio)
+    else:
+        parser.error("either --url or --compare is required")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
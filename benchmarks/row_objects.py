@@ -0,0 +1,67 @@
+"""Compare loading transactions as ORM instances against slotted row records
+
+Usage: python -m benchmarks.row_objects [--transactions N]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from strichliste import migrations
+from strichliste.database import db
+from strichliste.flask import create_app
+from strichliste.models import Transaction
+from strichliste.rows import TransactionRow, fetch_rows, row_query
+
+from benchmarks.ledger import seed_ledger
+from benchmarks.sqlite_profile import PROFILES, bench_config
+
+USERS = 50
+DAYS = 365
+REPEAT = 5
+
+
+def load_orm():
+    return Transaction.query.order_by(Transaction.id).all()
+
+
+def load_rows():
+    return fetch_rows(TransactionRow, row_query(TransactionRow).order_by(Transaction.id))
+
+
+def measure(load, count):
+    """Time loading and serializing every transaction, and the memory the loaded objects hold"""
+    timings = []
+    for x in range(REPEAT):
+        db.session.remove()
+        start = time.perf_counter()
+        [x.dict() for x in load()]
+        timings.append(time.perf_counter() - start)
+
+    db.session.remove()
+    tracemalloc.start()
+    loaded = load()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    identity_map = len(db.session.identity_map)
+    del loaded
+    db.session.remove()
+    return {'usPerRow': round(min(timings) / count * 10 ** 6, 2),
+            'bytesPerRow': round(size / count), 'peakBytesPerRow': round(peak / count),
+            'identityMapSize': identity_map}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=50000)
+    args = parser.parse_args()
+    app = create_app(bench_config(PROFILES['high-throughput']))
+    with app.app_context():
+        migrations.migrate()
+        seed_ledger(USERS, args.transactions, DAYS)
+        results = {'orm': measure(load_orm, args.transactions), 'rows': measure(load_rows, args.transactions)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
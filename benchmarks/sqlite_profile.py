@@ -0,0 +1,63 @@
+"""Compare SQLite's default settings against the high-throughput preset of strichliste.conf
+
+Usage: python -m benchmarks.sqlite_profile [--transactions N]
+"""
+import argparse
+import json
+import time
+
+from strichliste import migrations
+from strichliste.config import write_config
+from strichliste.flask import create_api, create_app
+
+PROFILES = {
+    'default': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'cache_size': -2000, 'mmap_size': 0,
+                'pool_size': 0},
+    'high-throughput': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536,
+                        'mmap_size': 268435456, 'pool_size': 8},
+}
+USERS = 20
+
+
+def bench_config(database, **sections):
+    """Write a config for a fresh benchmark database, see strichliste.config.write_config
+
+    Account limits are out of the way and the response cache is off so every request does the full work,
+    sections override either.
+    """
+    defaults = {'limits': {'account_upper': 10 ** 9, 'account_lower': -10 ** 9}, 'cache': {'enabled': 'no'}}
+    defaults.update(sections)
+    return write_config('strichliste-bench-', database=database, **defaults)
+
+
+def run_profile(database, transactions):
+    app = create_app(bench_config(database))
+    create_api(app)
+    with app.app_context():
+        migrations.migrate()
+    client = app.test_client()
+    for x in range(USERS):
+        client.post('/user', json={'name': 'user{}'.format(x), 'mailAddress': ''})
+
+    start = time.perf_counter()
+    for x in range(transactions):
+        client.post('/user/{}/transaction'.format(x % USERS + 1), json={'value': 100})
+    writes = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for x in range(transactions):
+        client.get('/user/{}'.format(x % USERS + 1))
+    reads = time.perf_counter() - start
+    return {'writesPerSecond': round(transactions / writes, 1), 'readsPerSecond': round(transactions / reads, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=500)
+    args = parser.parse_args()
+    results = {name: run_profile(database, args.transactions) for name, database in PROFILES.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
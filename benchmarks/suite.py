@@ -0,0 +1,165 @@
+"""Benchmark every endpoint and the middleware behind it on a synthetic ledger
+
+Usage: python -m benchmarks.suite [--users N] [--transactions N] [--days N] [-o results.json]
+       python -m benchmarks.suite --compare baseline.json results.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import time
+
+from strichliste import middleware, migrations
+from strichliste.database import db
+from strichliste.flask import create_api, create_app
+
+from benchmarks.ledger import seed_ledger
+from benchmarks.load_test import percentile
+from benchmarks.sqlite_profile import PROFILES, bench_config
+
+PAGE = 50
+
+
+def http_scenarios(users):
+    """(name, function of client and iteration), writes come last so reads see the seeded ledger"""
+    return [
+        ('GET /user', lambda client, x: client.get('/user')),
+        ('GET /user?limit', lambda client, x: client.get('/user', query_string={'limit': PAGE, 'offset': x % users})),
+        ('GET /user/<id>', lambda client, x: client.get('/user/{}'.format(x % users + 1))),
+        ('GET /user/<id>/transaction', lambda client, x: client.get(
+            '/user/{}/transaction'.format(x % users + 1), query_string={'limit': PAGE})),
+        ('GET /transaction?limit', lambda client, x: client.get(
+            '/transaction', query_string={'limit': PAGE, 'offset': x * PAGE})),
+        ('GET /transaction?after_id', lambda client, x: client.get(
+            '/transaction', query_string={'limit': PAGE, 'after_id': x * PAGE})),
+        ('GET /metrics', lambda client, x: client.get('/metrics', query_string={'days': 30})),
+        ('POST /user/<id>/transaction', lambda client, x: client.post(
+            '/user/{}/transaction'.format(x % users + 1), json={'value': 100})),
+    ]
+
+
+def middleware_scenarios(users):
+    return [
+        ('get_users', lambda x: middleware.get_users(None, None)),
+        ('get_user', lambda x: middleware.get_user(x % users + 1)),
+        ('get_users_transactions', lambda x: middleware.get_users_transactions(x % users + 1, limit=PAGE)),
+        ('get_transactions', lambda x: middleware.get_transactions(limit=PAGE, after_id=x * PAGE)),
+        ('get_global_metrics', lambda x: middleware.get_global_metrics()),
+        ('get_days_metrics', lambda x: middleware.get_days_metrics(datetime.date(2020, 1, 1), 30)),
+        ('insert_transaction', lambda x: middleware.insert_transaction(x % users + 1, 100)),
+    ]
+
+
+def summarize(latencies, duration):
+    return {'iterations': len(latencies),
+            'opsPerSecond': round(len(latencies) / duration, 1),
+            'meanMs': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50Ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p90Ms': round(percentile(latencies, 0.9) * 1000, 3),
+            'p99Ms': round(percentile(latencies, 0.99) * 1000, 3)}
+
+
+def run(func, iterations, warmup):
+    for x in range(warmup):
+        func(x)
+    latencies = []
+    start = time.perf_counter()
+    for x in range(iterations):
+        begin = time.perf_counter()
+        func(x)
+        latencies.append(time.perf_counter() - begin)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(args):
+    sections = {'cache': {'enabled': 'yes'}} if args.cache else {}
+    app = create_app(bench_config(dict(PROFILES[args.profile]), **sections))
+    create_api(app)
+    with app.app_context():
+        migrations.migrate()
+        seed_ledger(args.users, args.transactions, args.days, args.seed)
+
+    results = {'meta': {'revision': git_revision(), 'python': platform.python_version(),
+                        'date': datetime.datetime.utcnow().isoformat(), 'users': args.users,
+                        'transactions': args.transactions, 'days': args.days, 'seed': args.seed,
+                        'profile': args.profile, 'cache': args.cache, 'iterations': args.iterations},
+               'http': {}, 'middleware': {}}
+
+    client = app.test_client()
+    for name, func in http_scenarios(args.users):
+        results['http'][name] = run(lambda x: func(client, x), args.iterations, args.warmup)
+
+    def in_request(func):
+        def wrapper(x):
+            with app.app_context():
+                func(x)
+                db.session.remove()
+        return wrapper
+
+    for name, func in middleware_scenarios(args.users):
+        results['middleware'][name] = run(in_request(func), args.iterations, args.warmup)
+    return results
+
+
+def compare(baseline, current, threshold):
+    """Print the p50 and throughput change per scenario
+
+    :return: Names of the scenarios whose p50 got slower by more than threshold
+    """
+    regressions = []
+    print('{:<40} {:>10} {:>10} {:>8}'.format('scenario', 'p50 before', 'p50 after', 'change'))
+    for group in ('http', 'middleware'):
+        for name, after in current.get(group, {}).items():
+            before = baseline.get(group, {}).get(name)
+            if before is None:
+                continue
+            change = after['p50Ms'] / before['p50Ms'] - 1 if before['p50Ms'] else 0.0
+            label = '{} {}'.format(group, name)
+            flag = ' REGRESSION' if change > threshold else ''
+            print('{:<40} {:>10.3f} {:>10.3f} {:>+7.1%}{}'.format(label, before['p50Ms'], after['p50Ms'], change, flag))
+            if flag:
+                regressions.append(label)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--profile', choices=tuple(PROFILES), default='high-throughput')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    parser.add_argument('-o', '--output', default=None, help='write the results to this JSON file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), default=None,
+                        help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1, help='p50 slowdown reported as regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            regressions = compare(json.load(baseline), json.load(current), args.threshold)
+        return 1 if regressions else 0
+
+    results = benchmark(args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,3 @@
 #!/bin/sh
 
-sqlite3 /tmp/strichliste2.db "DELETE from transactions; DELETE from users;"
+sqlite3 /tmp/strichliste2.db "DELETE from transactions; DELETE from users; DELETE from daily_stats; DELETE from meta;"
@@ -1,26 +1,169 @@
-from flask_restful import Api
+import argparse
+import datetime
+import sys
 
-import strichliste.views
-from strichliste.database import db
-from strichliste.flask import create_app
-from strichliste.outputs import output_json
+from strichliste import archive, export, importer, middleware, migrations, ranking
+from strichliste.asgi import wrap_app
+from strichliste.config import Config
+from strichliste.flask import create_api, create_app
+from strichliste.prefork import PreforkServer
 
 
-def main():
-    app = create_app('./strichliste.conf')
-    api = Api(app)
+def serve(app, args):
+    config = Config()
+    if getattr(args, 'asgi', False):
+        try:
+            import uvicorn
+        except ImportError:
+            print("the ASGI server needs uvicorn, install it with 'pip install uvicorn'")
+            return 1
+        uvicorn.run(wrap_app(app), host=config.host, port=config.port, log_level='warning')
+        return 0
+
+    create_api(app)
+    with app.app_context():
+        migrations.migrate()
+        # forked workers inherit the index and only catch up from there
+        ranking.get_index(app)
+    if config.workers > 1:
+        PreforkServer(app, args.config).run()
+        return 0
+    app.run(host=config.host, port=config.port, debug=True)
+
+
+def reconcile(app, args):
+    with app.app_context():
+        migrations.migrate()
+        drift = middleware.reconcile_balances(fix=args.fix)
+    for entry in drift:
+        print("user {userId}: stored balance {stored} != ledger balance {ledger}".format(**entry))
+    if not drift:
+        print("all balances match the ledger")
+    elif args.fix:
+        print("fixed {} balances".format(len(drift)))
+    return 1 if drift and not args.fix else 0
+
+
+def backfill(app, args):
+    with app.app_context():
+        migrations.migrate()
+        days = middleware.backfill_rollups()
+    print("rebuilt daily statistics for {} days".format(days))
+    return 0
+
+
+def export_ledger(app, args):
+    end = args.end + datetime.timedelta(days=1) if args.end is not None else None
+    start = datetime.datetime.combine(args.start, datetime.time()) if args.start is not None else None
+    end = datetime.datetime.combine(end, datetime.time()) if end is not None else None
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        with app.app_context():
+            migrations.migrate()
+            for chunk in export.export_transactions(args.format, start, end, args.user):
+                output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    return 0
 
-    api.add_resource(strichliste.views.Settings, '/settings')
-    api.add_resource(strichliste.views.Metrics, '/metrics')
-    api.add_resource(strichliste.views.UserList, '/user')
-    api.add_resource(strichliste.views.User, '/user/<int:user_id>')
-    api.add_resource(strichliste.views.UserTransactionList, '/user/<int:user_id>/transaction')
-    api.add_resource(strichliste.views.UserTransaction, '/user/<int:user_id>/transaction/<int:transaction_id>')
-    api.add_resource(strichliste.views.Transaction, '/transaction')
-    api.representation('application/json')(output_json)
 
-    db.create_all(app=app)
-    app.run(port=8080, debug=True)
+def import_ledger(app, args):
+    if args.strichliste_db:
+        if args.users or args.transactions:
+            print("--strichliste-db can not be combined with --users/--transactions")
+            return 2
+    elif not (args.users and args.transactions):
+        print("either --strichliste-db or both --users and --transactions are required")
+        return 2
+    with app.app_context():
+        migrations.migrate()
+        try:
+            if args.strichliste_db:
+                users, transactions = importer.read_strichliste_db(args.strichliste_db)
+            else:
+                users, transactions = importer.read_files(args.users, args.transactions, args.euros)
+            user_count, transaction_count, seconds = importer.import_ledger(users, transactions, args.batch_size)
+        except (importer.ImportRejected, KeyError, ValueError) as e:
+            print("import failed, nothing was written: {}".format(e))
+            return 1
+    rows = user_count + transaction_count
+    print("imported {} users and {} transactions in {:.2f}s ({:.0f} rows/s)".format(
+        user_count, transaction_count, seconds, rows / seconds if seconds else rows))
+    return 0
+
+
+def archive_ledger(app, args):
+    if (args.before is None) == (args.keep_days is None):
+        print("either --before or --keep-days is required")
+        return 2
+    before = args.before
+    if before is None:
+        before = datetime.datetime.utcnow().date() - datetime.timedelta(days=args.keep_days)
+    with app.app_context():
+        migrations.migrate()
+        try:
+            moved = archive.archive_transactions(before)
+        except ValueError as e:
+            print("archive failed: {}".format(e))
+            return 1
+        years = archive.archive_years()
+    print("archived {} transactions created before {}, archive years: {}".format(
+        moved, before.isoformat(), ', '.join(str(x) for x in years) or 'none'))
+    return 0
+
+
+def migrate(app, args):
+    with app.app_context():
+        if args.status:
+            print("schema version {}".format(migrations.get_schema_version()))
+            for version, description, func in migrations.pending_migrations():
+                print("pending {}: {}".format(version, description))
+            return 0
+        applied = migrations.migrate()
+    for version, description in applied:
+        print("applied {}: {}".format(version, description))
+    if not applied:
+        print("schema is up to date")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Strichliste API server')
+    parser.add_argument('-c', '--config', default='./strichliste.conf', help='path to the config file')
+    subparsers = parser.add_subparsers(dest='command')
+    serve_parser = subparsers.add_parser('serve', help='run the API server (default)')
+    serve_parser.add_argument('--asgi', action='store_true', help='serve from uvicorn instead of the dev server')
+    reconcile_parser = subparsers.add_parser('reconcile', help='compare stored balances against the ledger')
+    reconcile_parser.add_argument('--fix', action='store_true', help='overwrite drifted balances')
+    subparsers.add_parser('backfill', help='rebuild the daily statistics and global counters from the ledger')
+    export_parser = subparsers.add_parser('export', help='write all transactions to a file or stdout')
+    export_parser.add_argument('--format', choices=tuple(export.EXPORT_FORMATS), default='ndjson')
+    export_parser.add_argument('--from', dest='start', type=datetime.date.fromisoformat, default=None,
+                               help='first day to include, YYYY-MM-DD')
+    export_parser.add_argument('--to', dest='end', type=datetime.date.fromisoformat, default=None,
+                               help='last day to include, YYYY-MM-DD')
+    export_parser.add_argument('--user', type=int, default=None, help='only export this user id')
+    export_parser.add_argument('-o', '--output', default=None, help='file to write, defaults to stdout')
+    import_parser = subparsers.add_parser('import', help='bulk load a ledger into an empty database')
+    import_parser.add_argument('--strichliste-db', default=None, help='SQLite database of the original Strichliste')
+    import_parser.add_argument('--users', default=None, help='users CSV or NDJSON file')
+    import_parser.add_argument('--transactions', default=None, help='transactions CSV or NDJSON file')
+    import_parser.add_argument('--euros', action='store_true', help='file values are euros instead of cents')
+    import_parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE)
+    archive_parser = subparsers.add_parser('archive', help='move old transactions into per-year archive tables')
+    archive_parser.add_argument('--before', type=datetime.date.fromisoformat, default=None,
+                                help='archive transactions created before this day, YYYY-MM-DD')
+    archive_parser.add_argument('--keep-days', type=int, default=None,
+                                help='archive transactions older than this many days')
+    migrate_parser = subparsers.add_parser('migrate', help='upgrade the database schema')
+    migrate_parser.add_argument('--status', action='store_true', help='only list pending migrations')
+    args = parser.parse_args()
+
+    commands = {None: serve, 'serve': serve, 'reconcile': reconcile, 'backfill': backfill,
+                'export': export_ledger, 'import': import_ledger, 'archive': archive_ledger, 'migrate': migrate}
+    app = create_app(args.config)
+    return commands[args.command](app, args)
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
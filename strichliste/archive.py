@@ -0,0 +1,117 @@
+import datetime
+import threading
+
+import sqlalchemy as sa
+
+from strichliste import middleware
+from strichliste.database import db
+from strichliste.models import ArchiveCarry, Meta, Transaction
+
+ARCHIVE_PREFIX = 'transactions_archive_'
+ARCHIVE_YEARS = 'archiveYears'
+ARCHIVE_CUTOFF = 'archiveCutoff'
+COLUMNS = ('id', 'userId', 'value', 'createDate')
+
+# archive tables live outside db.Model's metadata, so create_all leaves them to archive_transactions
+archive_metadata = sa.MetaData()
+_lock = threading.Lock()
+
+
+def archive_table(year):
+    name = '{}{:d}'.format(ARCHIVE_PREFIX, year)
+    with _lock:
+        table = archive_metadata.tables.get(name)
+        if table is None:
+            table = sa.Table(name, archive_metadata,
+                             sa.Column('id', sa.INTEGER, primary_key=True, autoincrement=False),
+                             sa.Column('userId', sa.INTEGER, nullable=False),
+                             sa.Column('value', sa.INTEGER, nullable=False),
+                             sa.Column('createDate', sa.DATETIME),
+                             sa.Index('ix_{}_userId_createDate'.format(name), 'userId', 'createDate'))
+    return table
+
+
+def year_range(year):
+    return datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1)
+
+
+def archive_years():
+    value = db.session.query(Meta.value).filter(Meta.key == ARCHIVE_YEARS).scalar()
+    return [int(x) for x in value.split(',')] if value else []
+
+
+def get_cutoff():
+    value = db.session.query(Meta.value).filter(Meta.key == ARCHIVE_CUTOFF).scalar()
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def ledger_source(start=None, end=None):
+    """Table to read transactions from, the hot table alone or a union with the archive tables
+
+    :param start: Skip archive years that end at or before this datetime
+    :param end: Skip archive years that start at or after this datetime
+    :return: Table or alias with the id, userId, value and createDate columns
+    """
+    hot = Transaction.__table__
+    years = [x for x in archive_years()
+             if (start is None or year_range(x)[1] > start) and (end is None or year_range(x)[0] < end)]
+    if not years:
+        return hot
+    tables = [archive_table(x) for x in years] + [hot]
+    return sa.union_all(*(sa.select([x.c[column] for column in COLUMNS]) for x in tables)).alias('ledger')
+
+
+def _archive(cutoff):
+    hot = Transaction.__table__
+    newest = db.session.query(sa.func.max(hot.c.id)).scalar()
+    if newest is None:
+        return 0
+    # the newest transaction always stays, SQLite would hand out its id again otherwise
+    moved = sa.and_(hot.c.createDate < cutoff, hot.c.id != newest)
+    oldest = db.session.query(sa.func.min(hot.c.createDate)).filter(moved).scalar()
+    if oldest is None:
+        return 0
+
+    years = set(archive_years())
+    for year in range(oldest.year, cutoff.year + 1):
+        first, last = year_range(year)
+        rows = sa.and_(moved, hot.c.createDate >= first, hot.c.createDate < last)
+        if db.session.query(hot.c.id).filter(rows).first() is None:
+            continue
+        table = archive_table(year)
+        table.create(bind=db.session.connection(), checkfirst=True)
+        db.session.execute(table.insert().from_select(COLUMNS, sa.select([hot.c[x] for x in COLUMNS]).where(rows)))
+        years.add(year)
+
+    carry = {x.userId: x for x in ArchiveCarry.query}
+    totals = db.session.query(hot.c.userId, sa.func.sum(hot.c.value), sa.func.count(hot.c.id),
+                              sa.func.max(hot.c.createDate)).filter(moved).group_by(hot.c.userId)
+    for user_id, balance, count, last in totals:
+        entry = carry.get(user_id)
+        if entry is None:
+            entry = carry[user_id] = ArchiveCarry(userId=user_id, balance=0, transactionCount=0)
+            db.session.add(entry)
+        entry.balance += balance
+        entry.transactionCount += count
+        entry.lastTransaction = max(last, entry.lastTransaction or last)
+
+    moved_count = db.session.execute(hot.delete().where(moved)).rowcount
+    db.session.merge(Meta(key=ARCHIVE_YEARS, value=','.join(str(x) for x in sorted(years))))
+    previous = get_cutoff()
+    db.session.merge(Meta(key=ARCHIVE_CUTOFF, value=max(cutoff, previous or cutoff).isoformat()))
+    return moved_count
+
+
+def archive_transactions(before):
+    """Move the transactions created before a day from the transactions table into per-year archive tables
+
+    Stored balances, counters and daily statistics stay as they are, archive_carry keeps what the moved
+    transactions add up to so that reconcile and backfill still see the whole ledger.
+
+    :param before: First day to keep in the transactions table, at most today so the statistics of the current
+        day keep coming from there
+    :return: Number of transactions moved
+    """
+    if before > datetime.datetime.utcnow().date():
+        raise ValueError("can not archive days that have not ended yet")
+    return middleware.run_write(_archive, datetime.datetime.combine(before, datetime.time()))
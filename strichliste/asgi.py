@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from strichliste import migrations, ranking
+from strichliste.config import Config
+from strichliste.database import READ_METHODS
+from strichliste.events import broker
+from strichliste.flask import create_api, create_app
+
+STREAM_PATH = '/transaction/stream'
+
+
+def build_environ(scope, body):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/{}'.format(scope['http_version']),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'] = server[0]
+    environ['SERVER_PORT'] = str(server[1])
+    client = scope.get('client')
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+class WsgiResponse:
+    def __init__(self, wsgi_app, environ):
+        self.status = 500
+        self.headers = []
+        self.chunks = iter(wsgi_app(environ, self.start_response))
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split(' ', 1)[0])
+        self.headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    def next_chunk(self):
+        for chunk in self.chunks:
+            if chunk:
+                return chunk
+        return None
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+class AsgiApp:
+    """Serve the WSGI app from an asyncio server
+
+    Requests are handed to bounded thread pools, reads and writes get separate pools so that writers queueing
+    for the database lock never hold up reads.
+    """
+
+    def __init__(self, wsgi_app, read_workers=16, write_workers=2):
+        self.wsgi_app = wsgi_app
+        self.read_pool = ThreadPoolExecutor(read_workers, thread_name_prefix='strichliste-read')
+        self.write_pool = ThreadPoolExecutor(write_workers, thread_name_prefix='strichliste-write')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.read_pool.shutdown(wait=False)
+                self.write_pool.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        if scope['path'] == STREAM_PATH and scope['method'] == 'GET':
+            await self.stream(scope, receive, send)
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        pool = self.read_pool if scope['method'] in READ_METHODS else self.write_pool
+        response = await loop.run_in_executor(pool, WsgiResponse, self.wsgi_app, build_environ(scope, bytes(body)))
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            chunk = await loop.run_in_executor(pool, response.next_chunk)
+            await send({'type': 'http.response.start', 'status': response.status, 'headers': response.headers})
+            while chunk is not None and not disconnected.done():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(pool, response.next_chunk)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            disconnected.cancel()
+            await loop.run_in_executor(pool, response.close)
+
+    async def stream(self, scope, receive, send):
+        """Serve the transaction stream natively, so subscribers wait on the event loop instead of a pool thread"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.read_pool, broker.start, self.wsgi_app)
+        headers = dict(scope['headers'])
+        last_event_id = headers.get(b'last-event-id')
+        last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                                (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]})
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        frames = broker.subscribe_async(Config().stream_keepalive, last_event_id)
+        try:
+            while not disconnected.done():
+                next_frame = asyncio.ensure_future(frames.__anext__())
+                await asyncio.wait([next_frame, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                if not next_frame.done():
+                    # the generator is closed below, it must not still be running __anext__ by then
+                    next_frame.cancel()
+                    with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration):
+                        await next_frame
+                    break
+                await send({'type': 'http.response.body', 'body': next_frame.result(), 'more_body': True})
+        finally:
+            disconnected.cancel()
+            await frames.aclose()
+
+    @staticmethod
+    async def wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+
+def wrap_app(app):
+    """Register the resources on a Flask app made by create_app, migrate and wrap it for an ASGI server"""
+    create_api(app)
+    with app.app_context():
+        migrations.migrate()
+        ranking.get_index(app)
+    config = Config()
+    return AsgiApp(app, config.read_workers, config.write_workers)
+
+
+def create_application(config_path):
+    return wrap_app(create_app(config_path))
+
+
+def application():
+    """Factory for ASGI servers, e.g. uvicorn --factory strichliste.asgi:application"""
+    return create_application(os.environ.get('STRICHLISTE_CONFIG', './strichliste.conf'))
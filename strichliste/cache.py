@@ -0,0 +1,112 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, request
+
+
+class ResponseCache:
+    """Size bounded LRU cache with a TTL, entries are tagged so writes can invalidate exactly what they touch"""
+
+    def __init__(self, size=256, ttl=5.0, enabled=True):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._tags = {}
+        self.configure(size, ttl, enabled)
+
+    def configure(self, size, ttl, enabled=True):
+        with self._lock:
+            self.size = size
+            self.ttl = ttl
+            self.enabled = enabled and size > 0
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._tags.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _remove(self, key):
+        expires, tags, value = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value, tags=()):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tuple(tags), value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'enabled': self.enabled, 'size': self.size, 'ttl': self.ttl, 'entries': len(self._entries),
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations,
+                    'hitRatio': self.hits / lookups if lookups else None}
+
+
+response_cache = ResponseCache()
+
+
+def user_tag(user_id):
+    return 'user:{}'.format(user_id)
+
+
+def cached(*tags):
+    """Cache successful results of a resource method, keyed by route and query args
+
+    :param tags: Invalidation tags, formatted with the view arguments, e.g. 'user:{user_id}'
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not response_cache.enabled:
+                return func(self, *args, **kwargs)
+            # the ETag set by @versioned ties entries to a ledger version, so writes in other processes
+            # are never served from this process' cache
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), g.get('etag'))
+            result = response_cache.get(key)
+            if result is None:
+                result = func(self, *args, **kwargs)
+                if result[1] == 200:
+                    response_cache.set(key, result, [x.format(**kwargs) for x in tags])
+            return result
+        return wrapper
+    return decorator
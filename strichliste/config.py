@@ -1,21 +1,154 @@
+import os
+import tempfile
 from configparser import ConfigParser
 
-from utils.Borg import Borg
-
-
-class Config(Borg):
-    _shared_state = {}
-
-    def __init__(self, config_path=None):
-        Borg.__init__(self)
-        if config_path is not None:
-            config = ConfigParser()
-            config.read(config_path)
-            self.upper_account_boundary = config.getint('limits', 'account_upper', fallback=100) * 100
-            self.lower_account_boundary = config.getint('limits', 'account_lower', fallback=-10) * 100
-            self.upper_transaction_boundary = config.getint('limits', 'transaction_upper', fallback=9999) * 100
-            self.lower_transaction_boundary = config.getint('limits', 'transaction_lower', fallback=-9999) * 100
-            self.db_path = config.get('base', 'db_path', fallback='/tmp/strichliste.db')
-            if ':///' not in self.db_path:
-                self.db_path = 'sqlite:///' + self.db_path
-            self.log_path = config.get('logging', 'path', fallback='/tmp/strichliste.log')
\ No newline at end of file
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+# Changing these only takes effect after a restart, a reload keeps the values the processes were started with
+RESTART_OPTIONS = ('db_path', 'log_path', 'host', 'port', 'workers', 'read_workers', 'write_workers',
+                   'db_pool_size', 'db_read_only', 'db_replica_url', 'instrumentation_enabled')
+
+
+class ConfigError(Exception):
+    pass
+
+
+class Config:
+    """Immutable application config
+
+    Config(path) parses and validates a file and makes the result the current config of the process,
+    Config() returns the current config. Reloading swaps in a new object, so code holding a reference keeps
+    seeing one consistent set of values.
+    """
+    __slots__ = ('path', 'upper_account_boundary', 'lower_account_boundary', 'upper_transaction_boundary',
+                 'lower_transaction_boundary', 'max_batch_size', 'db_path', 'log_path', 'host', 'port', 'workers',
+                 'read_workers', 'write_workers', 'cache_enabled', 'cache_size', 'cache_ttl', 'write_attempts',
+                 'write_backoff', 'db_journal_mode', 'db_synchronous', 'db_cache_size', 'db_mmap_size',
+                 'db_busy_timeout', 'db_pool_size', 'stream_poll_interval', 'stream_keepalive', 'stream_buffer',
+                 'instrumentation_enabled', 'slow_request_ms', 'group_commit', 'group_commit_interval_ms',
+                 'group_commit_size', 'db_read_only', 'db_replica_url', 'read_your_writes_ms',
+                 'embedded_transactions_limit', '_frozen')
+    _current = None
+
+    def __new__(cls, config_path=None):
+        if config_path is None:
+            if cls._current is None:
+                raise ConfigError("no config loaded")
+            return cls._current
+        config = super().__new__(cls)
+        config._load(config_path)
+        Config._current = config
+        return config
+
+    def __setattr__(self, key, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("config is immutable, reload it instead")
+        super().__setattr__(key, value)
+
+    def _load(self, config_path):
+        config = ConfigParser()
+        if not config.read(config_path):
+            raise ConfigError("could not read config file '{}'".format(config_path))
+        try:
+            self._parse(config)
+        except ValueError as e:
+            raise ConfigError(str(e))
+        self.path = config_path
+        self._validate()
+        self._frozen = True
+
+    def _parse(self, config):
+        self.upper_account_boundary = config.getint('limits', 'account_upper', fallback=100) * 100
+        self.lower_account_boundary = config.getint('limits', 'account_lower', fallback=-10) * 100
+        self.upper_transaction_boundary = config.getint('limits', 'transaction_upper', fallback=9999) * 100
+        self.lower_transaction_boundary = config.getint('limits', 'transaction_lower', fallback=-9999) * 100
+        self.max_batch_size = config.getint('limits', 'batch_size', fallback=1000)
+        self.embedded_transactions_limit = config.getint('limits', 'embedded_transactions', fallback=10)
+        self.db_path = config.get('base', 'db_path', fallback='/tmp/strichliste.db')
+        if ':///' not in self.db_path:
+            self.db_path = 'sqlite:///' + self.db_path
+        self.log_path = config.get('logging', 'path', fallback='/tmp/strichliste.log')
+        self.host = config.get('server', 'host', fallback='127.0.0.1')
+        self.port = config.getint('server', 'port', fallback=8080)
+        self.workers = config.getint('server', 'workers', fallback=1)
+        self.read_workers = config.getint('server', 'read_workers', fallback=16)
+        self.write_workers = config.getint('server', 'write_workers', fallback=2)
+        self.cache_enabled = config.getboolean('cache', 'enabled', fallback=True)
+        self.cache_size = config.getint('cache', 'size', fallback=256)
+        self.cache_ttl = config.getfloat('cache', 'ttl', fallback=5.0)
+        self.write_attempts = config.getint('database', 'write_attempts', fallback=5)
+        self.write_backoff = config.getfloat('database', 'write_backoff', fallback=0.05)
+        self.db_journal_mode = config.get('database', 'journal_mode', fallback='DELETE').upper()
+        self.db_synchronous = config.get('database', 'synchronous', fallback='FULL').upper()
+        self.db_cache_size = config.getint('database', 'cache_size', fallback=-2000)
+        self.db_mmap_size = config.getint('database', 'mmap_size', fallback=0)
+        self.db_busy_timeout = config.getint('database', 'busy_timeout', fallback=5000)
+        self.db_pool_size = config.getint('database', 'pool_size', fallback=0)
+        self.db_read_only = config.getboolean('database', 'read_only', fallback=False)
+        self.db_replica_url = config.get('database', 'replica_url', fallback='') or None
+        self.read_your_writes_ms = config.getfloat('database', 'read_your_writes_ms', fallback=1000.0)
+        self.group_commit = config.getboolean('database', 'group_commit', fallback=False)
+        self.group_commit_interval_ms = config.getfloat('database', 'group_commit_interval_ms', fallback=2.0)
+        self.group_commit_size = config.getint('database', 'group_commit_size', fallback=100)
+        self.stream_poll_interval = config.getfloat('stream', 'poll_interval', fallback=1.0)
+        self.stream_keepalive = config.getfloat('stream', 'keepalive', fallback=15.0)
+        self.stream_buffer = config.getint('stream', 'buffer', fallback=1024)
+        self.instrumentation_enabled = config.getboolean('instrumentation', 'enabled', fallback=False)
+        self.slow_request_ms = config.getfloat('instrumentation', 'slow_request_ms', fallback=500.0)
+
+    def _validate(self):
+        errors = []
+        if self.lower_account_boundary > self.upper_account_boundary:
+            errors.append("limits.account_lower is above limits.account_upper")
+        if self.lower_transaction_boundary > self.upper_transaction_boundary:
+            errors.append("limits.transaction_lower is above limits.transaction_upper")
+        if self.db_journal_mode not in JOURNAL_MODES:
+            errors.append("database.journal_mode must be one of {}".format(', '.join(JOURNAL_MODES)))
+        if self.db_synchronous not in SYNCHRONOUS_LEVELS:
+            errors.append("database.synchronous must be one of {}".format(', '.join(SYNCHRONOUS_LEVELS)))
+        for name in ('max_batch_size', 'workers', 'read_workers', 'write_workers', 'write_attempts', 'stream_buffer',
+                     'group_commit_size'):
+            if getattr(self, name) < 1:
+                errors.append("{} must be at least 1".format(name))
+        for name in ('cache_size', 'cache_ttl', 'write_backoff', 'db_pool_size', 'db_busy_timeout', 'slow_request_ms',
+                     'group_commit_interval_ms', 'read_your_writes_ms', 'embedded_transactions_limit'):
+            if getattr(self, name) < 0:
+                errors.append("{} must not be negative".format(name))
+        for name in ('stream_poll_interval', 'stream_keepalive'):
+            if getattr(self, name) <= 0:
+                errors.append("{} must be positive".format(name))
+        if self.db_read_only and not self.db_path.startswith('sqlite:///'):
+            errors.append("database.read_only needs a SQLite database, use database.replica_url otherwise")
+        if errors:
+            raise ConfigError('; '.join(errors))
+
+    def restart_changes(self, other):
+        return [x for x in RESTART_OPTIONS if getattr(self, x) != getattr(other, x)]
+
+    @property
+    def sqlite_pragmas(self):
+        return ['PRAGMA journal_mode={}'.format(self.db_journal_mode),
+                'PRAGMA synchronous={}'.format(self.db_synchronous),
+                'PRAGMA cache_size={:d}'.format(self.db_cache_size),
+                'PRAGMA mmap_size={:d}'.format(self.db_mmap_size),
+                'PRAGMA busy_timeout={:d}'.format(self.db_busy_timeout)]
+
+
+def write_config(prefix='strichliste-', **sections):
+    """Write a config file pointing at a fresh database in a new temporary directory, for tests and benchmarks
+
+    :param prefix: Prefix of the temporary directory
+    :param sections: Config sections, e.g. limits={'account_lower': -100}
+    :return: Path of the config file
+    """
+    directory = tempfile.mkdtemp(prefix=prefix)
+    sections.setdefault('base', {})['db_path'] = os.path.join(directory, 'strichliste.db')
+    sections.setdefault('logging', {})['path'] = os.path.join(directory, 'strichliste.log')
+    config_path = os.path.join(directory, 'strichliste.conf')
+    with open(config_path, 'w') as config_file:
+        for section, options in sections.items():
+            config_file.write('[{}]\n'.format(section))
+            for key, value in options.items():
+                config_file.write('{} = {}\n'.format(key, value))
+    return config_path
@@ -1,4 +1,135 @@
-from flask_sqlalchemy import SQLAlchemy
+import collections
+import functools
+import sqlite3
+import threading
+import time
 
-db = SQLAlchemy()
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+from sqlalchemy.engine import Engine
 
+from strichliste.config import Config
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# clients remembered for read-your-writes, the oldest are dropped first
+MAX_RECENT_WRITERS = 4096
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends everything to the read engine while g.read_only is set"""
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_app_context() and g.get('read_only'):
+            engine = self.app.extensions.get('read_engine')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+
+@sa.event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in Config().sqlite_pragmas:
+        try:
+            cursor.execute(pragma)
+        except sqlite3.OperationalError as e:
+            # read-only connections can not switch the journal mode, they get whatever the writers set up
+            if 'readonly' not in str(e):
+                raise
+    cursor.close()
+
+
+def engine_options(config, url=None):
+    url = url or config.db_path
+    if url.startswith('sqlite') and config.db_pool_size > 0:
+        return {'poolclass': sa.pool.QueuePool, 'pool_size': config.db_pool_size,
+                'connect_args': {'check_same_thread': False}}
+    return {}
+
+
+def read_url(config):
+    """URL of the engine for reads, None if reads go to the primary"""
+    if config.db_replica_url:
+        return config.db_replica_url
+    if config.db_read_only:
+        return 'sqlite:///file:{}?mode=ro&uri=true'.format(config.db_path[len('sqlite:///'):])
+    return None
+
+
+class RecentWriters:
+    """Clients that wrote within the read-your-writes window, their reads stay on the primary"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._writes = collections.OrderedDict()
+
+    def add(self, client):
+        with self._lock:
+            self._writes[client] = time.monotonic()
+            self._writes.move_to_end(client)
+            while len(self._writes) > MAX_RECENT_WRITERS:
+                self._writes.popitem(last=False)
+
+    def wrote_within(self, client, seconds):
+        with self._lock:
+            written = self._writes.get(client)
+        return written is not None and time.monotonic() - written < seconds
+
+
+def init_read_routing(app, config):
+    """Route GET requests to a read-only engine, if [database] read_only or replica_url configure one"""
+    url = read_url(config)
+    if url is None:
+        return
+    app.extensions['read_engine'] = sa.create_engine(url, **engine_options(config, url))
+    recent_writers = app.extensions['recent_writers'] = RecentWriters()
+
+    @app.before_request
+    def route_reads():
+        g.read_only = request.method in READ_METHODS and not recent_writers.wrote_within(
+            request.remote_addr, Config().read_your_writes_ms / 1000)
+
+    @app.after_request
+    def remember_writer(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            recent_writers.add(request.remote_addr)
+        return response
+
+
+def get_read_engine():
+    engine = current_app.extensions.get('read_engine')
+    return engine if engine is not None else db.engine
+
+
+def dispose_engines(app):
+    with app.app_context():
+        db.engine.dispose()
+    engine = app.extensions.get('read_engine')
+    if engine is not None:
+        engine.dispose()
+
+
+def read_only(func):
+    """Run a middleware function on the read engine, unless the request already decided where it reads from"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if g.get('read_only') is not None:
+            return func(*args, **kwargs)
+        g.read_only = True
+        try:
+            return func(*args, **kwargs)
+        finally:
+            g.pop('read_only', None)
+    return wrapper
@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import itertools
+import threading
+
+import sqlalchemy as sa
+
+from strichliste import middleware
+from strichliste.config import Config
+from strichliste.database import db
+from strichliste.models import Transaction
+from strichliste.outputs import encode_json
+from strichliste.rows import TransactionRow, fetch_rows, row_query
+
+RETRY_MS = 3000
+KEEPALIVE_FRAME = b': keepalive\n\n'
+
+
+def encode_event(transaction, counters):
+    data = {'transaction': transaction.dict(),
+            'overallBalance': counters[middleware.COUNTER_BALANCE],
+            'countTransactions': counters[middleware.COUNTER_TRANSACTIONS],
+            'countUsers': counters[middleware.COUNTER_USERS],
+            'avgBalance': middleware.average_balance(counters[middleware.COUNTER_BALANCE],
+                                                     counters[middleware.COUNTER_USERS])}
+    return b'id: %d\nevent: transaction\ndata: %s\n' % (transaction.id, encode_json(data))
+
+
+def encode_events(transactions, counters):
+    """Encode transactions oldest first, each with the global figures as they were right after it
+
+    :param counters: Counters after the newest of the transactions
+    """
+    frames = []
+    counters = dict(counters)
+    for transaction in reversed(transactions):
+        frames.append(encode_event(transaction, counters))
+        counters[middleware.COUNTER_BALANCE] -= transaction.value
+        counters[middleware.COUNTER_TRANSACTIONS] -= 1
+    frames.reverse()
+    return frames
+
+
+def counters_at(transaction_id):
+    """Global counters as they were right after a transaction, the stored ones may already include newer ones"""
+    counters = middleware.get_counters()
+    count, value = db.session.query(sa.func.count(Transaction.id), sa.func.sum(Transaction.value)).filter(
+        Transaction.id > transaction_id).one()
+    counters[middleware.COUNTER_TRANSACTIONS] -= count
+    counters[middleware.COUNTER_BALANCE] -= value or 0
+    return counters
+
+
+class TransactionBroker:
+    """Fans committed transactions out to any number of stream subscribers
+
+    A single thread per process tails the transactions table by id, so writes from other worker processes and
+    batch imports show up as well, and local commits wake it immediately through notify(). Every event is
+    encoded once into a ring buffer, subscribers only keep their position in it.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._wakeup = threading.Event()
+        self._events = collections.deque()
+        self._seq = 0
+        self._last_id = 0
+        self._async_waiters = set()
+        self._thread = None
+        self.app = None
+
+    def start(self, app):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self.app = app
+            with app.app_context():
+                self._last_id = db.session.query(sa.func.max(Transaction.id)).scalar() or 0
+                db.session.remove()
+            self._thread = threading.Thread(target=self._tail, name='strichliste-stream', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self._wakeup.set()
+
+    def _tail(self):
+        while True:
+            config = Config()
+            self._wakeup.wait(config.stream_poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    self._fetch(config.stream_buffer)
+                    db.session.remove()
+            except Exception as e:
+                self.app.logger.error("Could not read new transactions for the stream: {}".format(e))
+
+    def _fetch(self, batch_size):
+        while True:
+            transactions = Transaction.query.filter(Transaction.id > self._last_id).order_by(
+                Transaction.id).limit(batch_size).all()
+            if not transactions:
+                return
+            frames = encode_events(transactions, counters_at(transactions[-1].id))
+            self._publish(transactions[-1].id, frames, batch_size)
+
+    def _publish(self, last_id, frames, buffer_size):
+        with self._condition:
+            for frame in frames:
+                self._seq += 1
+                self._events.append((self._seq, frame))
+            while len(self._events) > buffer_size:
+                self._events.popleft()
+            self._last_id = last_id
+            self._condition.notify_all()
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    def _collect(self, seq):
+        if not self._events or seq >= self._seq:
+            return [], self._seq
+        # sequence numbers are contiguous, subscribers that fell behind the buffer skip what was dropped
+        start = max(0, seq - self._events[0][0] + 1)
+        return [frame for event_seq, frame in itertools.islice(self._events, start, None)], self._seq
+
+    def _position(self):
+        with self._condition:
+            return self._seq, self._last_id
+
+    def replay(self, last_event_id, up_to_id):
+        """Frames a reconnecting client missed, like the ring buffer at most stream_buffer of the newest ones"""
+        if last_event_id is None or last_event_id >= up_to_id:
+            return []
+        with self.app.app_context():
+            query = row_query(TransactionRow).filter(Transaction.id > last_event_id, Transaction.id <= up_to_id)
+            transactions = fetch_rows(TransactionRow, query.order_by(Transaction.id.desc()).limit(
+                Config().stream_buffer))
+            transactions.reverse()
+            frames = encode_events(transactions, counters_at(up_to_id))
+            db.session.remove()
+        return frames
+
+    def subscribe(self, keepalive, last_event_id=None):
+        """Blocking generator of SSE frames for a WSGI response"""
+        seq, last_id = self._position()
+        yield 'retry: {}\n\n'.format(RETRY_MS).encode('utf-8')
+        for frame in self.replay(last_event_id, last_id):
+            yield frame
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._seq > seq, timeout=keepalive)
+                frames, seq = self._collect(seq)
+            yield b''.join(frames) if frames else KEEPALIVE_FRAME
+
+    async def subscribe_async(self, keepalive, last_event_id=None):
+        """Async generator of SSE frames, subscribers do not hold a thread while waiting"""
+        loop = asyncio.get_running_loop()
+        seq, last_id = self._position()
+        yield 'retry: {}\n\n'.format(RETRY_MS).encode('utf-8')
+        for frame in await loop.run_in_executor(None, self.replay, last_event_id, last_id):
+            yield frame
+        while True:
+            with self._condition:
+                frames, seq = self._collect(seq)
+                if not frames:
+                    waiter = (loop, loop.create_future())
+                    self._async_waiters.add(waiter)
+            if frames:
+                yield b''.join(frames)
+                continue
+            try:
+                await asyncio.wait_for(waiter[1], keepalive)
+            except asyncio.TimeoutError:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+                yield KEEPALIVE_FRAME
+            except asyncio.CancelledError:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+                raise
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+broker = TransactionBroker()
@@ -0,0 +1,75 @@
+import csv
+import io
+
+import sqlalchemy as sa
+
+from strichliste import archive
+from strichliste.database import get_read_engine
+from strichliste.outputs import encode_json
+
+EXPORT_COLUMNS = ('id', 'userId', 'value', 'createDate')
+BATCH_SIZE = 1000
+
+
+def export_query(start=None, end=None, user_id=None):
+    """Select the exported columns only, in ledger order, archive tables included
+
+    :param start: Include transactions created at or after this datetime
+    :param end: Include transactions created before this datetime
+    """
+    table = archive.ledger_source(start, end)
+    query = sa.select([table.c[x] for x in EXPORT_COLUMNS]).order_by(table.c.id)
+    if start is not None:
+        query = query.where(table.c.createDate >= start)
+    if end is not None:
+        query = query.where(table.c.createDate < end)
+    if user_id is not None:
+        query = query.where(table.c.userId == user_id)
+    return query
+
+
+def iter_batches(engine, query, batch_size=BATCH_SIZE):
+    """Fetch rows from a server side cursor, at most batch_size of them are held at a time
+
+    Uses its own connection rather than the session, so the generator may outlive the request context and be
+    resumed from any thread.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True).execute(query)
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+
+
+def encode_ndjson(batches):
+    for rows in batches:
+        yield b''.join(encode_json({'id': x[0], 'userId': x[1], 'value': x[2], 'createDate': x[3]}) for x in rows)
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue().encode('utf-8')
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((x[0], x[1], x[2], x[3].isoformat()) for x in rows)
+        yield buffer.getvalue().encode('utf-8')
+
+
+# format: (encoder, mimetype)
+EXPORT_FORMATS = {'ndjson': (encode_ndjson, 'application/x-ndjson'),
+                  'csv': (encode_csv, 'text/csv')}
+
+
+def export_transactions(fmt, start=None, end=None, user_id=None, batch_size=BATCH_SIZE):
+    """Encoded chunks of the matching transactions, one per batch
+
+    :param fmt: One of EXPORT_FORMATS
+    :return: Generator of bytes
+    """
+    encoder, mimetype = EXPORT_FORMATS[fmt]
+    return encoder(iter_batches(get_read_engine(), export_query(start, end, user_id), batch_size))
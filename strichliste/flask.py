@@ -2,12 +2,17 @@ import logging
 import logging.handlers
 import time
 
-from strichliste.database import db
+from strichliste.database import db, engine_options, init_read_routing
 from flask import Flask
-from strichliste import error_handlers
-from strichliste.config import Config
+from flask_restful import Api
+from strichliste import error_handlers, views
+from strichliste.cache import response_cache
+from strichliste.config import Config, ConfigError
+from strichliste.instrumentation import instrumentation
+from strichliste.outputs import output_json
 
 LOGGING_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_HANDLERS = ('strichliste-stream', 'strichliste-file')
 
 
 def initialize_logger(app):
@@ -25,6 +30,13 @@ def initialize_logger(app):
     file_handler.setFormatter(formatter)
     file_handler.setLevel(logging.INFO)
 
+    # every app shares the strichliste.flask logger, replace the handlers an earlier app added
+    for handler in [x for x in app.logger.handlers if x.get_name() in LOG_HANDLERS]:
+        app.logger.removeHandler(handler)
+        handler.close()
+    stream_handler.set_name(LOG_HANDLERS[0])
+    file_handler.set_name(LOG_HANDLERS[1])
+
     app.logger.setLevel(logging.DEBUG)
     app.logger.addHandler(stream_handler)
     app.logger.addHandler(file_handler)
@@ -37,11 +49,53 @@ def create_app(config_path):
     config = Config(config_path)
     app.config['SQLALCHEMY_DATABASE_URI'] = config.db_path
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config)
     app.config['APP_LOGFILE'] = config.log_path
     db.init_app(app)
+    init_read_routing(app, config)
+    response_cache.configure(config.cache_size, config.cache_ttl, config.cache_enabled)
 
     initialize_logger(app)
+    if config.instrumentation_enabled:
+        instrumentation.init_app(app)
 
     app.errorhandler(404)(error_handlers.page_not_found)
     return app
 
+
+def reload_config(app, config_path):
+    """Re-read the config file and swap it in, keeping the old config if the new one is invalid
+
+    :return: The config in effect afterwards
+    """
+    old = Config()
+    try:
+        config = Config(config_path)
+    except ConfigError as e:
+        app.logger.error("Could not reload config, keeping the previous one: {}".format(e))
+        return old
+    for option in old.restart_changes(config):
+        app.logger.warning("Config option '{}' changed, this needs a restart to take effect".format(option))
+    response_cache.configure(config.cache_size, config.cache_ttl, config.cache_enabled)
+    app.logger.info("Config reloaded from '{}'".format(config_path))
+    return config
+
+
+def create_api(app):
+    api = Api(app)
+
+    api.add_resource(views.Settings, '/settings')
+    api.add_resource(views.Metrics, '/metrics')
+    api.add_resource(views.UserList, '/user')
+    api.add_resource(views.UserRanking, '/user/ranking')
+    api.add_resource(views.User, '/user/<int:user_id>')
+    api.add_resource(views.UserTransactionList, '/user/<int:user_id>/transaction')
+    api.add_resource(views.UserTransaction, '/user/<int:user_id>/transaction/<int:transaction_id>')
+    api.add_resource(views.Transaction, '/transaction')
+    api.add_resource(views.TransactionBatch, '/transaction/batch')
+    api.add_resource(views.TransactionStream, '/transaction/stream')
+    api.add_resource(views.TransactionExport, '/transaction/export')
+    api.add_resource(views.CacheStats, '/internal/cache')
+    api.add_resource(views.InternalStats, '/internal/stats')
+    api.representation('application/json')(output_json)
+    return api
@@ -0,0 +1,85 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from strichliste import middleware
+from strichliste.config import Config
+from strichliste.database import db
+from strichliste.models import Transaction
+
+
+class GroupCommitWriter:
+    """Commits transactions from many requests together, so a rush of purchases shares one fsync
+
+    A single writer thread per process takes what has queued up within group_commit_interval_ms, at most
+    group_commit_size items, and validates them in submission order against the balances running through the
+    group. Every item is checked with all earlier ones applied, whether or not they are committed yet.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='strichliste-group-commit', daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id, value):
+        """Queue a transaction whose value was already checked
+
+        :return: Future resolving to the committed Transaction, or to the exception rejecting it
+        """
+        future = Future()
+        self._queue.put((user_id, value, future))
+        return future
+
+    def _collect(self):
+        group = [self._queue.get()]
+        config = Config()
+        deadline = time.monotonic() + config.group_commit_interval_ms / 1000
+        while len(group) < config.group_commit_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                group.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return group
+
+    def _run(self):
+        while True:
+            self._commit(self._collect())
+
+    def _commit(self, group):
+        items = [(user_id, value) for user_id, value, future in group]
+        try:
+            with self.app.app_context():
+                results, mappings = middleware.run_write(middleware._insert_group, items)
+                db.session.remove()
+        except Exception as e:
+            self.app.logger.error("Could not commit transaction group: {e} - count='{count}'".format(
+                e=e, count=len(group)))
+            for user_id, value, future in group:
+                future.set_exception(e)
+            return
+
+        inserted = iter(mappings)
+        for (user_id, value, future), error in zip(group, results):
+            if error is None:
+                future.set_result(Transaction(**next(inserted)))
+            else:
+                future.set_exception(error)
+
+
+_lock = threading.Lock()
+
+
+def get_writer(app):
+    """The app's writer, started on first use so that pre-forked workers each get their own thread"""
+    writer = app.extensions.get('group_commit')
+    if writer is None:
+        with _lock:
+            writer = app.extensions.get('group_commit')
+            if writer is None:
+                writer = app.extensions['group_commit'] = GroupCommitWriter(app)
+    return writer
@@ -0,0 +1,143 @@
+import csv
+import datetime
+import itertools
+import json
+import os
+import sqlite3
+import time
+
+import sqlalchemy as sa
+
+from strichliste import middleware
+from strichliste.database import db
+from strichliste.models import Transaction, User
+
+BATCH_SIZE = 5000
+
+
+class ImportRejected(Exception):
+    pass
+
+
+def parse_date(value):
+    if isinstance(value, datetime.datetime):
+        date = value
+    elif value in (None, ''):
+        return datetime.datetime.utcnow()
+    else:
+        date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def to_cents(value, euros):
+    return int(round(float(value) * 100)) if euros else int(value)
+
+
+def user_row(row):
+    active = row.get('active')
+    return {'id': int(row['id']), 'name': row['name'], 'mailAddress': row.get('mailAddress') or '',
+            'createDate': parse_date(row.get('createDate')),
+            'active': 1 if active in (None, '') else int(str(active).lower() not in ('0', 'false'))}
+
+
+def transaction_row(row, euros=False):
+    return {'id': int(row['id']), 'userId': int(row['userId']), 'value': to_cents(row['value'], euros),
+            'createDate': parse_date(row.get('createDate'))}
+
+
+def read_file(path):
+    """Yield dicts from a CSV file with a header line or from an NDJSON file"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as source:
+        if extension == '.csv':
+            yield from csv.DictReader(source)
+        elif extension in ('.ndjson', '.jsonl', '.json'):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise ImportRejected("unknown file type '{}', expected .csv or .ndjson".format(extension))
+
+
+def read_files(users_path, transactions_path, euros=False):
+    """Read the users and transactions files, values are in cents like /transaction/export writes them
+
+    :param euros: Values are euros instead
+    """
+    return ((user_row(x) for x in read_file(users_path)),
+            (transaction_row(x, euros) for x in read_file(transactions_path)))
+
+
+def read_strichliste_db(path):
+    """Read the SQLite database of the original Strichliste
+
+    The original stores values as euros in a REAL column, a database of this implementation keeps integer cents.
+    """
+    connection = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+    connection.row_factory = sqlite3.Row
+    value_type = [x['type'] for x in connection.execute('PRAGMA table_info(transactions)') if x['name'] == 'value']
+    if not value_type:
+        raise ImportRejected("'{}' has no transactions table".format(path))
+    euros = 'INT' not in value_type[0].upper()
+
+    def users():
+        for row in connection.execute('SELECT * FROM users ORDER BY id'):
+            yield user_row(dict(row))
+
+    def transactions():
+        for row in connection.execute('SELECT id, userId, value, createDate FROM transactions ORDER BY id'):
+            yield transaction_row(dict(row), euros)
+        connection.close()
+
+    return users(), transactions()
+
+
+def insert_batches(table, rows, batch_size):
+    rows = iter(rows)
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return count
+        db.session.execute(table.insert(), batch)
+        count += len(batch)
+
+
+def import_ledger(users, transactions, batch_size=BATCH_SIZE):
+    """Bulk insert users and transactions into an empty database and rebuild everything derived from them
+
+    Everything happens in one database transaction, references are checked once after all rows are in.
+
+    :param users: Iterable of user dicts, ids are kept
+    :param transactions: Iterable of transaction dicts, ids are kept
+    :return: (user count, transaction count, seconds)
+    """
+    start = time.perf_counter()
+    try:
+        middleware.begin_write()
+        if db.session.query(User.id).first() is not None or db.session.query(Transaction.id).first() is not None:
+            raise ImportRejected("the database already contains users or transactions")
+        user_count = insert_batches(User.__table__, users, batch_size)
+        transaction_count = insert_batches(Transaction.__table__, transactions, batch_size)
+
+        orphans = db.session.query(sa.func.count(Transaction.id)).filter(
+            ~Transaction.userId.in_(db.session.query(User.id))).scalar()
+        if orphans:
+            raise ImportRejected("{} transactions reference users that do not exist".format(orphans))
+
+        balance = db.session.query(sa.func.coalesce(sa.func.sum(Transaction.value), 0)).filter(
+            Transaction.userId == User.id).as_scalar()
+        count = db.session.query(sa.func.count(Transaction.id)).filter(Transaction.userId == User.id).as_scalar()
+        User.query.update({User.balance: balance, User.transactionCount: count, User.version: User.version + 1},
+                          synchronize_session=False)
+        # commits the whole import
+        middleware.backfill_rollups()
+    except sa.exc.IntegrityError as e:
+        db.session.rollback()
+        raise ImportRejected(str(e.orig))
+    except Exception:
+        db.session.rollback()
+        raise
+    return user_count, transaction_count, time.perf_counter() - start
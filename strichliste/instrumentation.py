@@ -0,0 +1,149 @@
+import bisect
+import threading
+import time
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context, request
+
+from strichliste.config import Config
+
+# upper bounds of the latency histogram buckets in milliseconds, the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RequestStats:
+    __slots__ = ('start', 'sql_count', 'sql_time', 'statements')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.statements = []
+
+
+class EndpointStats:
+    __slots__ = ('count', 'errors', 'latency', 'latency_max', 'buckets', 'sql_count', 'sql_time', 'response_bytes')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.response_bytes = 0
+
+    def add(self, latency, status, request_stats, response_bytes):
+        self.count += 1
+        if status >= 500:
+            self.errors += 1
+        self.latency += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, latency * 1000)] += 1
+        self.sql_count += request_stats.sql_count
+        self.sql_time += request_stats.sql_time
+        self.response_bytes += response_bytes
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the percentile, None if it is in the open-ended bucket"""
+        rank = self.count * fraction
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def dict(self):
+        return {'count': self.count, 'errors': self.errors,
+                'latencyMeanMs': round(self.latency / self.count * 1000, 3),
+                'latencyMaxMs': round(self.latency_max * 1000, 3),
+                'latencyP50Ms': self.percentile(0.5), 'latencyP95Ms': self.percentile(0.95),
+                'latencyP99Ms': self.percentile(0.99),
+                'latencyHistogram': {'le': list(LATENCY_BUCKETS_MS) + [None], 'counts': list(self.buckets)},
+                'sqlStatements': self.sql_count, 'sqlStatementsMean': round(self.sql_count / self.count, 2),
+                'sqlTimeMs': round(self.sql_time * 1000, 3),
+                'responseBytes': self.response_bytes,
+                'responseBytesMean': round(self.response_bytes / self.count)}
+
+
+class Instrumentation:
+    """Per endpoint request statistics of this process, fed by Flask request hooks and SQLAlchemy cursor events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._listening = False
+
+    def init_app(self, app):
+        if not self._listening:
+            sa.event.listen(sa.engine.Engine, 'before_cursor_execute', _before_cursor_execute)
+            sa.event.listen(sa.engine.Engine, 'after_cursor_execute', _after_cursor_execute)
+            sa.event.listen(sa.engine.Engine, 'handle_error', _handle_error)
+            self._listening = True
+        app.before_request(_before_request)
+        app.after_request(self._after_request)
+        app.extensions['instrumentation'] = self
+
+    def _after_request(self, response):
+        request_stats = g.pop('request_stats', None)
+        if request_stats is None:
+            return response
+        latency = time.perf_counter() - request_stats.start
+        rule = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        endpoint = '{} {}'.format(request.method, rule)
+        # streamed responses have no length up front and count as empty
+        response_bytes = response.content_length or 0
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.add(latency, response.status_code, request_stats, response_bytes)
+
+        threshold = Config().slow_request_ms
+        if threshold and latency * 1000 >= threshold:
+            queries = ''.join('\n  {:.3f} ms: {}'.format(duration * 1000, statement)
+                              for statement, duration in request_stats.statements)
+            current_app.logger.warning(("Slow request - endpoint='{}', path='{}', duration_ms='{:.1f}', "
+                                        "queries='{}', sql_ms='{:.1f}'{}").format(
+                endpoint, request.full_path, latency * 1000, request_stats.sql_count, request_stats.sql_time * 1000,
+                queries))
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: stats.dict() for endpoint, stats in sorted(self._endpoints.items())}
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+def _before_request():
+    g.request_stats = RequestStats()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_request_context():
+        return
+    request_stats = g.get('request_stats')
+    if request_stats is None:
+        return
+    request_stats.sql_count += 1
+    request_stats.sql_time += duration
+    request_stats.statements.append((statement, duration))
+
+
+def _handle_error(context):
+    # failed statements never reach after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_start'):
+        context.connection.info['query_start'].pop()
+
+
+instrumentation = Instrumentation()
@@ -1,14 +1,26 @@
 import datetime
 import decimal
+import time
 
 import sqlalchemy as sa
 from flask import current_app
 
 import sqlalchemy.exc
 
+from strichliste import archive, cache, events, group_commit, ranking
+from strichliste.rows import TransactionRow, UserRow, fetch_rows, row_query
 from strichliste.config import Config
-from strichliste.models import User, Transaction
-from strichliste.database import db
+from strichliste.models import ArchiveCarry, DailyStats, Meta, User, Transaction
+from strichliste.database import db, read_only
+
+
+COUNTER_TRANSACTIONS = 'transactionCount'
+COUNTER_BALANCE = 'globalBalance'
+COUNTER_USERS = 'userCount'
+COUNTERS = (COUNTER_TRANSACTIONS, COUNTER_BALANCE, COUNTER_USERS)
+LEDGER_VERSION = 'ledgerVersion'
+# meta row every writer locks on backends without BEGIN IMMEDIATE
+WRITE_LOCK = 'writeLock'
 
 
 class DuplicateUser(Exception):
@@ -67,7 +79,12 @@ class TransactionResultLow(TransactionResultLimit):
                                                                               limit=self.limit)
 
 
-def insert_transaction(user_id: int, value: int) -> Transaction:
+class BatchRejected(Exception):
+    def __init__(self, results):
+        self.results = results
+
+
+def check_transaction_value(value):
     config = Config()
     max_transaction = config.upper_transaction_boundary
     min_transaction = config.lower_transaction_boundary
@@ -78,110 +95,519 @@ def insert_transaction(user_id: int, value: int) -> Transaction:
     elif value < min_transaction:
         raise TransactionValueLow(value, min_transaction)
 
-    user = User.query.get(user_id)
-    if user is None:
-        raise KeyError
 
+def check_account_balance(value, new_balance):
+    config = Config()
     max_account = config.upper_account_boundary
     min_account = config.lower_account_boundary
-    new_balance = user.balance + value
     if new_balance > max_account:
         raise TransactionResultHigh(value, max_account, new_balance)
     elif new_balance < min_account:
         raise TransactionResultLow(value, min_account, new_balance)
 
-    transaction = Transaction(userId=user_id, value=value)
-    try:
-        db.session.add(transaction)
-        db.session.commit()
-    except sqlalchemy.exc.DatabaseError as e:
-        raise DatabaseError
+
+def is_locked_error(error):
+    return 'database is locked' in str(error.orig)
+
+
+def begin_write():
+    """Take the database write lock before anything is read for a write
+
+    SQLite only locks on the first write of a deferred transaction, so two writers could both read the same
+    balance. BEGIN IMMEDIATE serializes them up front. Other backends lock the write lock row for update instead,
+    locking only the users' rows would leave the daily statistics and counters open to concurrent writers.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        db.session.query(Meta.key).filter(Meta.key == WRITE_LOCK).with_for_update().one()
+        return
+    connection = db.session.connection()
+    if not connection.connection.in_transaction:
+        connection.execute('BEGIN IMMEDIATE')
+
+
+def lock_balances(user_ids):
+    query = db.session.query(User.id, User.balance).filter(User.id.in_(user_ids))
+    if db.engine.dialect.name != 'sqlite':
+        query = query.with_for_update()
+    return dict(query)
+
+
+def run_write(func, *args):
+    """Run func in a write locked database transaction and commit it
+
+    Retries with exponential backoff while the database is locked by another writer, any exception rolls the
+    transaction back.
+
+    :return: Return value of func
+    """
+    config = Config()
+    for attempt in range(1, config.write_attempts + 1):
+        try:
+            begin_write()
+            result = func(*args)
+            db.session.commit()
+            return result
+        except sqlalchemy.exc.OperationalError as e:
+            db.session.rollback()
+            if not is_locked_error(e) or attempt == config.write_attempts:
+                raise DatabaseError(str(e))
+            time.sleep(config.write_backoff * 2 ** (attempt - 1))
+        except sqlalchemy.exc.IntegrityError:
+            db.session.rollback()
+            raise
+        except sqlalchemy.exc.DatabaseError as e:
+            db.session.rollback()
+            raise DatabaseError(str(e))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def validate_transactions(items, balances):
+    """Check transactions against the boundaries, applying each valid one to the running balances
+
+    :param items: Sequence of (user_id, value) pairs
+    :param balances: Current balance by user id, updated in place
+    :return: None or the exception for every item
+    """
+    results = []
+    for user_id, value in items:
+        try:
+            check_transaction_value(value)
+            if user_id not in balances:
+                raise KeyError(user_id)
+            new_balance = balances[user_id] + value
+            check_account_balance(value, new_balance)
+            balances[user_id] = new_balance
+            results.append(None)
+        except (TransactionValue, KeyError) as e:
+            results.append(e)
+    return results
+
+
+def _insert_transaction(user_id, value):
+    balances = lock_balances([user_id])
+    if user_id not in balances:
+        raise KeyError
+    check_account_balance(value, balances[user_id] + value)
+
+    transaction = Transaction(userId=user_id, value=value, createDate=datetime.datetime.utcnow())
+    record_ledger_effects([(user_id, value, transaction.createDate)])
+    db.session.add(transaction)
+    return transaction
+
+
+def insert_transaction(user_id: int, value: int) -> Transaction:
+    check_transaction_value(value)
+    if Config().group_commit:
+        transaction = group_commit.get_writer(current_app._get_current_object()).submit(user_id, value).result()
+    else:
+        transaction = run_write(_insert_transaction, user_id, value)
+    cache.response_cache.invalidate('users', cache.user_tag(user_id), 'transactions', 'metrics')
+    events.broker.notify()
+    ranking.note_transactions(current_app._get_current_object(), [
+        (transaction.id, transaction.userId, transaction.value, transaction.createDate)])
     return transaction
 
 
-def get_users_transactions(user_id, limit=None, offset=None):
+def insert_mappings(mappings):
+    """Insert transaction mappings with a single executemany and set their ids
+
+    Must run under the lock begin_write takes. SQLite hands out max(id) + 1 to every row, so the batch gets the
+    contiguous range of ids ending at the new maximum. Other backends give no such guarantee and fetch the id of
+    each row as it is inserted.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        db.session.bulk_insert_mappings(Transaction, mappings, return_defaults=True)
+        return
+    db.session.execute(Transaction.__table__.insert(), mappings)
+    last_id = db.session.query(sa.func.max(Transaction.id)).scalar()
+    for transaction_id, mapping in zip(range(last_id - len(mappings) + 1, last_id + 1), mappings):
+        mapping['id'] = transaction_id
+
+
+def _insert_transactions(items):
+    balances = lock_balances({user_id for user_id, value in items})
+    results = validate_transactions(items, balances)
+    if any(x is not None for x in results):
+        raise BatchRejected(results)
+
+    create_date = datetime.datetime.utcnow()
+    mappings = [{'userId': user_id, 'value': value, 'createDate': create_date} for user_id, value in items]
+    record_ledger_effects([(user_id, value, create_date) for user_id, value in items])
+    insert_mappings(mappings)
+    return mappings
+
+
+def _insert_group(items):
+    """Insert the valid ones of independently submitted transactions
+
+    :param items: Sequence of (user_id, value) pairs, each is checked against the balance left by the preceding ones
+    :return: None or the exception for every item, and the mappings of the inserted ones in order
+    """
+    balances = lock_balances({user_id for user_id, value in items})
+    results = validate_transactions(items, balances)
+    create_date = datetime.datetime.utcnow()
+    mappings = [{'userId': user_id, 'value': value, 'createDate': create_date}
+                for (user_id, value), error in zip(items, results) if error is None]
+    if mappings:
+        record_ledger_effects([(x['userId'], x['value'], create_date) for x in mappings])
+        insert_mappings(mappings)
+    return results, mappings
+
+
+def insert_transactions(items):
+    """Validate and insert a batch of transactions, all or nothing
+
+    Every item is checked against the transaction boundaries and against the account boundaries using the
+    balance its user will have after the preceding items of the batch.
+
+    :param items: Sequence of (user_id, value) pairs
+    :return: The inserted transactions as dicts, in the order of items
+    :raises BatchRejected: If any item is invalid, results holds None or the exception for every item
+    """
+    mappings = run_write(_insert_transactions, items)
+    cache.response_cache.invalidate('users', 'transactions', 'metrics',
+                                    *(cache.user_tag(user_id) for user_id, value in items))
+    events.broker.notify()
+    ranking.note_transactions(current_app._get_current_object(), [
+        (x['id'], x['userId'], x['value'], x['createDate']) for x in mappings])
+    return [Transaction(**x).dict() for x in mappings]
+
+
+def increment_counter(key, delta):
+    value = sa.cast(sa.cast(Meta.value, sa.INTEGER) + delta, sa.TEXT)
+    updated = Meta.query.filter(Meta.key == key).update({Meta.value: value}, synchronize_session=False)
+    if not updated:
+        db.session.add(Meta(key=key, value=str(delta)))
+
+
+def get_ledger_version(user_id=None):
+    """Look up the version that changes whenever the data behind a response changes
+
+    :param user_id: Return the version of this user's ledger instead of the global one
+    :return: Version number or None if the user does not exist
+    """
+    if user_id is not None:
+        return db.session.query(User.version).filter(User.id == user_id).scalar()
+    version = db.session.query(Meta.value).filter(Meta.key == LEDGER_VERSION).scalar()
+    return int(version) if version is not None else 0
+
+
+def get_counters():
+    counters = {key: 0 for key in COUNTERS}
+    counters.update({key: int(value) for key, value in
+                     db.session.query(Meta.key, Meta.value).filter(Meta.key.in_(COUNTERS))})
+    return counters
+
+
+def record_ledger_effects(entries):
+    """Update every value derived from the ledger for transactions that are about to be added
+
+    Must run in the same database transaction as the insert and before the transactions are added to the
+    session, so that the distinct user check does not see the transactions themselves.
+
+    :param entries: Sequence of (user_id, value, create_date) triples
+    """
+    user_deltas = {}
+    user_counts = {}
+    days = {}
+    for user_id, value, create_date in entries:
+        user_deltas[user_id] = user_deltas.get(user_id, 0) + value
+        user_counts[user_id] = user_counts.get(user_id, 0) + 1
+        day = days.setdefault(create_date.date(), {'count': 0, 'positive': 0, 'negative': 0, 'users': set()})
+        day['count'] += 1
+        day['positive' if value > 0 else 'negative'] += value
+        day['users'].add(user_id)
+
+    for user_id, delta in user_deltas.items():
+        User.query.filter(User.id == user_id).update({User.balance: User.balance + delta,
+                                                      User.transactionCount: User.transactionCount +
+                                                      user_counts[user_id],
+                                                      User.version: User.version + 1},
+                                                     synchronize_session=False)
+
+    for date, day in days.items():
+        day_start = datetime.datetime.combine(date, datetime.time())
+        seen = db.session.query(sa.distinct(Transaction.userId)).filter(
+            Transaction.userId.in_(day['users']),
+            Transaction.createDate >= day_start,
+            Transaction.createDate < day_start + datetime.timedelta(days=1)).count()
+        new_users = len(day['users']) - seen
+        updated = DailyStats.query.filter(DailyStats.date == date).update({
+            DailyStats.overallNumber: DailyStats.overallNumber + day['count'],
+            DailyStats.distinctUsers: DailyStats.distinctUsers + new_users,
+            DailyStats.dayBalancePositive: DailyStats.dayBalancePositive + day['positive'],
+            DailyStats.dayBalanceNegative: DailyStats.dayBalanceNegative + day['negative']},
+            synchronize_session=False)
+        if not updated:
+            db.session.add(DailyStats(date=date, overallNumber=day['count'], distinctUsers=new_users,
+                                      dayBalancePositive=day['positive'], dayBalanceNegative=day['negative']))
+
+    increment_counter(COUNTER_TRANSACTIONS, len(entries))
+    increment_counter(COUNTER_BALANCE, sum(user_deltas.values()))
+    increment_counter(LEDGER_VERSION, 1)
+
+
+def paginate_transactions(source, query, limit=None, offset=None, after_id=None, before_id=None, count=None):
+    """Fetch one page of transactions, either by offset or by keyset cursor
+
+    :param source: Table the query selects from, see archive.ledger_source
+    :param query: Transaction row_query to page through
+    :param after_id: Cursor mode, return the transactions following this id
+    :param before_id: Cursor mode, return the transactions preceding this id
+    :param count: Whether to compute overallCount, defaults to only doing so in offset mode
+    :return: Page dict, nextCursor continues the page in the same direction
+    """
+    cursor_mode = after_id is not None or before_id is not None
+    if count is None:
+        count = not cursor_mode
+    overall_count = query.count() if count else None
+    if after_id is not None:
+        result = fetch_rows(TransactionRow,
+                            query.filter(source.c.id > after_id).order_by(source.c.id).limit(limit))
+    elif before_id is not None:
+        result = fetch_rows(TransactionRow,
+                            query.filter(source.c.id < before_id).order_by(source.c.id.desc()).limit(limit))
+        result.reverse()
+    else:
+        result = fetch_rows(TransactionRow, query.order_by(source.c.id).offset(offset).limit(limit))
+
+    next_cursor = None
+    if result and limit is not None and len(result) == limit:
+        next_cursor = result[0].id if before_id is not None else result[-1].id
+    entries = [x.dict() for x in result]
+    return {'overallCount': overall_count, 'limit': limit, 'offset': offset, 'nextCursor': next_cursor,
+            'entries': entries}
+
+
+@read_only
+def get_transactions(limit=None, offset=None, after_id=None, before_id=None, count=None):
+    source = archive.ledger_source()
+    return paginate_transactions(source, row_query(TransactionRow, source), limit, offset, after_id, before_id, count)
+
+
+@read_only
+def get_users_transactions(user_id, limit=None, offset=None, after_id=None, before_id=None, count=None):
     user = User.query.get(user_id)
     if user is None:
         raise KeyError
-    count = Transaction.query.filter(Transaction.userId == user.id).count()
-    result = Transaction.query.filter(Transaction.userId == user.id).offset(offset).limit(limit).all()
-    entries = [x.dict() for x in result]
-    return {'overallCount': count, 'limit': limit, 'offset': offset, 'entries': entries}
+    source = archive.ledger_source()
+    query = row_query(TransactionRow, source).filter(source.c.userId == user.id)
+    return paginate_transactions(source, query, limit, offset, after_id, before_id, count)
+
+
+@read_only
+def get_transaction(transaction_id):
+    """Look up a transaction in the transactions table, then in the archive
+
+    :return: TransactionRow or None
+    """
+    query = row_query(TransactionRow).filter(Transaction.id == transaction_id)
+    result = fetch_rows(TransactionRow, query)
+    if not result:
+        source = archive.ledger_source()
+        if source is not Transaction.__table__:
+            result = fetch_rows(TransactionRow, row_query(TransactionRow, source).filter(source.c.id == transaction_id))
+    return result[0] if result else None
 
 
+@read_only
 def get_users(limit, offset):
     count = User.query.count()
-    result = User.query.offset(offset).limit(limit).all()
-    entries = [x.dict() for x in result]
+    entries = [x.dict() for x in fetch_rows(UserRow, row_query(UserRow).order_by(User.id).offset(offset).limit(limit))]
     users = {'overallCount': count, 'limit': limit, 'offset': offset, 'entries': entries}
     return users
 
 
-def get_user(user_id):
+@read_only
+def get_user(user_id, transactions_limit=None):
+    """Load a user with its most recent transactions
+
+    :param transactions_limit: Number of transactions to embed, defaults to limits.embedded_transactions
+    :return: User dict, transactions are in ledger order and countTransactions is the user's total
+    """
+    if transactions_limit is None:
+        transactions_limit = Config().embedded_transactions_limit
     try:
-        user = User.query.get(user_id)
+        user = db.session.query(User.id, User.name, User.balance, User.transactionCount).filter(
+            User.id == user_id).first()
         if user is None:
             current_app.logger.warning("Could not find user: User ID not found - user_id='{}'".format(user_id))
             raise KeyError
-        out_dict = user.dict()
-        out_dict['transactions'] = [x.dict() for x in user.transactions]
-        return out_dict
+        # served from ix_transactions_userId_createDate, at least one row to know the last transaction
+        limit = max(transactions_limit, 1)
+        query = row_query(TransactionRow).filter(Transaction.userId == user_id).order_by(
+            Transaction.createDate.desc(), Transaction.id.desc()).limit(limit)
+        recent = fetch_rows(TransactionRow, query)
+        if len(recent) < min(limit, user.transactionCount):
+            # the rest is archived, everything there is older than what the transactions table holds
+            source = archive.ledger_source()
+            query = row_query(TransactionRow, source).filter(source.c.userId == user_id).order_by(
+                source.c.createDate.desc(), source.c.id.desc()).limit(limit)
+            recent = fetch_rows(TransactionRow, query)
+        return {'id': user.id, 'name': user.name, 'balance': user.balance,
+                'lastTransaction': recent[0].createDate if recent else None,
+                'countTransactions': user.transactionCount,
+                'transactions': [x.dict() for x in reversed(recent[:transactions_limit])]}
     except sqlalchemy.exc.SQLAlchemyError as e:
         current_app.logger.error("Unexpected SQLAlchemyError: {error} - user_id='{user_id}".format(error=e,
                                                                                                    user_id=user_id))
         raise DatabaseError("SQLAlchemyError: {error}".format(error=e))
 
 
+def _insert_user(name, email):
+    user = User(name=name, mailAddress=email)
+    db.session.add(user)
+    increment_counter(COUNTER_USERS, 1)
+    increment_counter(LEDGER_VERSION, 1)
+    return user
+
+
 def insert_user(name, email=''):
     try:
-        user = User(name=name, mailAddress=email)
-        db.session.add(user)
-        db.session.commit()
+        user = run_write(_insert_user, name, email)
     except sqlalchemy.exc.IntegrityError:
-        raise DuplicateUser(user.name)
+        raise DuplicateUser(name)
+    cache.response_cache.invalidate('users', 'metrics')
+    ranking.note_user(current_app._get_current_object(), user.id, user.name)
     return user
 
 
-def get_global_balance():
-    ret = db.session.query(sa.func.sum(Transaction.value)).first()
-    if ret[0] is None:
-        ret = 0
+@read_only
+def get_ranking(by, limit, window=None, descending=True):
+    """Top users by balance or by their number of transactions in the last window days
+
+    Served from the process' RankingIndex after catching up on what was written since the last call.
+    """
+    index = ranking.get_index(current_app._get_current_object())
+    index.sync()
+    return index.top(by, limit, window, descending)
+
+
+def reconcile_balances(fix=False):
+    # archived transactions count with the totals carried forward in archive_carry
+    ledger = dict(db.session.query(ArchiveCarry.userId, ArchiveCarry.balance))
+    for user_id, value in db.session.query(Transaction.userId, sa.func.sum(Transaction.value)).group_by(
+            Transaction.userId):
+        ledger[user_id] = ledger.get(user_id, 0) + value
+    drift = []
+    for user_id, stored in db.session.query(User.id, User.balance).order_by(User.id):
+        actual = ledger.get(user_id, 0)
+        if stored != actual:
+            drift.append({'userId': user_id, 'stored': stored, 'ledger': actual})
+    if fix and drift:
+        for entry in drift:
+            User.query.filter(User.id == entry['userId']).update({User.balance: entry['ledger'],
+                                                                  User.version: User.version + 1},
+                                                                 synchronize_session=False)
+        increment_counter(LEDGER_VERSION, 1)
+        db.session.commit()
+        cache.response_cache.invalidate('users', *(cache.user_tag(x['userId']) for x in drift))
+    return drift
+
+
+def aggregate_days(start=None, end=None):
+    day = sa.func.date(Transaction.createDate)
+    query = db.session.query(
+        day,
+        sa.func.count(Transaction.id),
+        sa.func.count(sa.distinct(Transaction.userId)),
+        sa.func.sum(sa.case([(Transaction.value > 0, Transaction.value)], else_=0)),
+        sa.func.sum(sa.case([(Transaction.value < 0, Transaction.value)], else_=0)))
+    if start is not None:
+        query = query.filter(Transaction.createDate >= start)
+    if end is not None:
+        query = query.filter(Transaction.createDate < end)
+    for date, count, distinct_users, positive, negative in query.group_by(day):
+        if not isinstance(date, datetime.date):
+            date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        yield DailyStats(date=date, overallNumber=count, distinctUsers=distinct_users,
+                         dayBalancePositive=positive, dayBalanceNegative=negative)
+
+
+def backfill_rollups():
+    """Rebuild the daily_stats table and the global counters from the raw ledger
+
+    Days before the archive cutoff keep their statistics, the counters add the archive_carry totals.
+
+    :return: Number of days written
+    """
+    cutoff = archive.get_cutoff()
+    if cutoff is None:
+        DailyStats.query.delete(synchronize_session=False)
     else:
-        ret = ret[0]
-    return ret
+        DailyStats.query.filter(DailyStats.date >= cutoff.date()).delete(synchronize_session=False)
+    days = list(aggregate_days(start=cutoff))
+    db.session.add_all(days)
+    transaction_count, global_balance = db.session.query(
+        sa.func.count(Transaction.id), sa.func.coalesce(sa.func.sum(Transaction.value), 0)).one()
+    archived_count, archived_balance = db.session.query(
+        sa.func.coalesce(sa.func.sum(ArchiveCarry.transactionCount), 0),
+        sa.func.coalesce(sa.func.sum(ArchiveCarry.balance), 0)).one()
+    counters = {COUNTER_TRANSACTIONS: transaction_count + archived_count,
+                COUNTER_BALANCE: global_balance + archived_balance,
+                COUNTER_USERS: db.session.query(sa.func.count(User.id)).scalar()}
+    for key, value in counters.items():
+        db.session.merge(Meta(key=key, value=str(value)))
+    increment_counter(LEDGER_VERSION, 1)
+    db.session.commit()
+    return len(days)
+
+
+@read_only
+def get_global_balance():
+    return get_counters()[COUNTER_BALANCE]
 
 
-def get_average_balance():
-    user_count = User.query.count()
+def average_balance(global_balance, user_count):
     if user_count <= 0:
         return 0
-    global_balance = decimal.Decimal(get_global_balance())
-    avg = decimal.Decimal(global_balance / user_count)
+    avg = decimal.Decimal(decimal.Decimal(global_balance) / user_count)
     return int(avg.to_integral_value(decimal.ROUND_05UP))
 
 
-def get_day_metrics(date: datetime.date):
-    daily_transactions = Transaction.query.filter(Transaction.createDate >= date,
-                                                  Transaction.createDate <= date + datetime.timedelta(days=1)).all()
-    ret = {'date': date.isoformat(),
-           'overallNumber': len(daily_transactions),
-           'distinctUsers': len(set((x.userId for x in daily_transactions))),
-           'dayBalance': sum((x.value for x in daily_transactions)),
-           'dayBalancePositive': sum((x.value if x.value > 0 else 0 for x in daily_transactions)),
-           'dayBalanceNegative': sum((x.value if x.value < 0 else 0 for x in daily_transactions))
-           }
+@read_only
+def get_average_balance():
+    counters = get_counters()
+    return average_balance(counters[COUNTER_BALANCE], counters[COUNTER_USERS])
+
+
+@read_only
+def get_global_metrics():
+    counters = get_counters()
+    return {'countTransactions': counters[COUNTER_TRANSACTIONS],
+            'overallBalance': counters[COUNTER_BALANCE],
+            'countUsers': counters[COUNTER_USERS],
+            'avgBalance': average_balance(counters[COUNTER_BALANCE], counters[COUNTER_USERS])}
+
+
+@read_only
+def get_days_metrics(first_day: datetime.date, days: int):
+    """Read the daily figures of a window of days from the daily_stats rollup
+
+    :param first_day: Oldest day of the window
+    :param days: Number of days in the window
+    :return: One metrics dict per day, oldest first, days without transactions included
+    """
+    last_day = first_day + datetime.timedelta(days=days - 1)
+    stored = {x.date: x for x in DailyStats.query.filter(DailyStats.date >= first_day, DailyStats.date <= last_day)}
+    ret = []
+    for offset in range(days):
+        date = first_day + datetime.timedelta(days=offset)
+        ret.append(stored.get(date, DailyStats(date=date, overallNumber=0, distinctUsers=0,
+                                               dayBalancePositive=0, dayBalanceNegative=0)).dict())
     return ret
 
 
+@read_only
+def get_day_metrics(date: datetime.date):
+    return get_days_metrics(date, 1)[0]
+
+
+@read_only
 def get_day_metrics_float(date: datetime.date):
-    daily_transactions = Transaction.query.filter(Transaction.createDate >= date,
-                                                  Transaction.createDate <= date + datetime.timedelta(days=1)).all()
-    ret = {'date': date.isoformat(),
-           'overallNumber': len(daily_transactions),
-           'distinctUsers': len(set((x.userId for x in daily_transactions))),
-           'dayBalance': sum((x.value for x in daily_transactions)) / 100,
-           'dayBalancePositive': sum((x.value if x.value > 0 else 0 for x in daily_transactions)) / 100,
-           'dayBalanceNegative': sum((x.value if x.value < 0 else 0 for x in daily_transactions)) / 100
-           }
+    ret = get_day_metrics(date)
+    for key in ('dayBalance', 'dayBalancePositive', 'dayBalanceNegative'):
+        ret[key] /= 100
     return ret
-
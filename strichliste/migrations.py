@@ -0,0 +1,90 @@
+import sqlalchemy as sa
+
+from strichliste import middleware
+from strichliste.database import db
+from strichliste.models import Meta, Transaction, User
+
+SCHEMA_VERSION = 'schemaVersion'
+
+
+def _columns(table):
+    return {x['name'] for x in sa.inspect(db.session.connection()).get_columns(table)}
+
+
+def _indexes(table):
+    return {x['name'] for x in sa.inspect(db.session.connection()).get_indexes(table)}
+
+
+def add_user_columns():
+    columns = _columns(User.__tablename__)
+    if 'version' not in columns:
+        db.session.execute('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    if 'balance' not in columns:
+        db.session.execute('ALTER TABLE users ADD COLUMN balance INTEGER NOT NULL DEFAULT 0')
+        middleware.reconcile_balances(fix=True)
+
+
+def build_rollups():
+    if Meta.query.filter(Meta.key.in_(middleware.COUNTERS)).count() < len(middleware.COUNTERS):
+        middleware.backfill_rollups()
+
+
+def index_transactions():
+    existing = _indexes(Transaction.__tablename__)
+    if 'ix_transactions_userId' in existing:
+        db.session.execute('DROP INDEX ix_transactions_userId')
+    for index in Transaction.__table__.indexes:
+        if index.name not in existing:
+            index.create(bind=db.session.connection())
+
+
+def add_transaction_count():
+    if 'transactionCount' in _columns(User.__tablename__):
+        return
+    db.session.execute('ALTER TABLE users ADD COLUMN transactionCount INTEGER NOT NULL DEFAULT 0')
+    count = db.session.query(sa.func.count(Transaction.id)).filter(Transaction.userId == User.id).as_scalar()
+    User.query.update({User.transactionCount: count}, synchronize_session=False)
+
+
+def add_write_lock():
+    if db.session.query(Meta.key).filter(Meta.key == middleware.WRITE_LOCK).first() is None:
+        db.session.add(Meta(key=middleware.WRITE_LOCK, value=''))
+
+
+MIGRATIONS = [
+    (1, "add stored balance and version columns to users", add_user_columns),
+    (2, "build daily statistics and global counters", build_rollups),
+    (3, "index transactions by (userId, createDate) and createDate", index_transactions),
+    (4, "add stored transaction count to users", add_transaction_count),
+    (5, "add the write lock row for backends without BEGIN IMMEDIATE", add_write_lock),
+]
+
+
+def get_schema_version():
+    if Meta.__tablename__ not in sa.inspect(db.session.connection()).get_table_names():
+        return 0
+    version = db.session.query(Meta.value).filter(Meta.key == SCHEMA_VERSION).scalar()
+    return int(version) if version is not None else 0
+
+
+def pending_migrations():
+    version = get_schema_version()
+    return [x for x in MIGRATIONS if x[0] > version]
+
+
+def migrate():
+    """Create missing tables and bring existing ones up to the current schema version
+
+    Every migration is idempotent, so fresh databases that create_all already built in the final shape
+    pass through them without changes.
+
+    :return: (version, description) of each applied migration
+    """
+    db.create_all()
+    applied = []
+    for version, description, func in pending_migrations():
+        func()
+        db.session.merge(Meta(key=SCHEMA_VERSION, value=str(version)))
+        db.session.commit()
+        applied.append((version, description))
+    return applied
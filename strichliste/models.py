@@ -1,6 +1,5 @@
 import datetime
 
-import sqlalchemy as sa
 from sqlalchemy.orm import relationship
 
 from strichliste.database import db
@@ -13,18 +12,11 @@ class User(db.Model):
     createDate = db.Column(db.DATETIME, default=datetime.datetime.utcnow())
     active = db.Column(db.INTEGER, default=1, nullable=False)
     mailAddress = db.Column(db.TEXT)
+    balance = db.Column(db.INTEGER, default=0, server_default='0', nullable=False)
+    version = db.Column(db.INTEGER, default=0, server_default='0', nullable=False)
+    transactionCount = db.Column(db.INTEGER, default=0, server_default='0', nullable=False)
     transactions = relationship('Transaction', back_populates='user')
 
-    @property
-    def balance(self) -> int:
-        ret = db.session.query(sa.func.sum(Transaction.value)).filter(
-                Transaction.userId == self.id).first()
-        if ret[0] is None:
-            ret = 0
-        else:
-            ret = ret[0]
-        return ret
-
     @property
     def lastTransaction(self):
         ret = Transaction.query.filter(Transaction.userId == self.id).order_by(
@@ -41,15 +33,18 @@ class User(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (db.Index('ix_transactions_userId_createDate', 'userId', 'createDate'),
+                      db.Index('ix_transactions_createDate', 'createDate'))
     id = db.Column(db.INTEGER, primary_key=True, autoincrement=True)
-    userId = db.Column(db.INTEGER, db.ForeignKey('users.id'), nullable=False, index=True)
+    userId = db.Column(db.INTEGER, db.ForeignKey('users.id'), nullable=False)
     user = relationship("User", back_populates="transactions")
     createDate = db.Column(db.DATETIME, default=datetime.datetime.utcnow)
     value = db.Column(db.INTEGER, nullable=False)
 
     def dict(self):
+        # createDate stays a datetime, outputs.encode_json writes it in ISO 8601
         return {'id': self.id, 'userId': self.userId,
-                'value': self.value, 'createDate': self.createDate.isoformat()}
+                'value': self.value, 'createDate': self.createDate}
 
     def __repr__(self):
         return "<Transaction: User: {user}, Value: {value}>".format(user=self.user.name, value=self.value)
@@ -61,3 +56,27 @@ class Meta(db.Model):
     value = db.Column(db.TEXT)
 
 
+class DailyStats(db.Model):
+    __tablename__ = 'daily_stats'
+    date = db.Column(db.DATE, primary_key=True)
+    overallNumber = db.Column(db.INTEGER, default=0, nullable=False)
+    distinctUsers = db.Column(db.INTEGER, default=0, nullable=False)
+    dayBalancePositive = db.Column(db.INTEGER, default=0, nullable=False)
+    dayBalanceNegative = db.Column(db.INTEGER, default=0, nullable=False)
+
+    def dict(self):
+        return {'date': self.date.isoformat(),
+                'overallNumber': self.overallNumber,
+                'distinctUsers': self.distinctUsers,
+                'dayBalance': self.dayBalancePositive + self.dayBalanceNegative,
+                'dayBalancePositive': self.dayBalancePositive,
+                'dayBalanceNegative': self.dayBalanceNegative}
+
+
+class ArchiveCarry(db.Model):
+    """What each user's archived transactions add up to, see strichliste.archive"""
+    __tablename__ = 'archive_carry'
+    userId = db.Column(db.INTEGER, db.ForeignKey('users.id'), primary_key=True)
+    balance = db.Column(db.INTEGER, default=0, nullable=False)
+    transactionCount = db.Column(db.INTEGER, default=0, nullable=False)
+    lastTransaction = db.Column(db.DATETIME)
@@ -1,14 +1,71 @@
+import datetime
+import json
+
 import flask
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 HEADERS_JSON = {'Content-Type': 'application/json'}
 
 
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+def encode_json_stdlib(data, pretty=False):
+    if pretty:
+        return (json.dumps(data, indent=2, separators=(', ', ': '), sort_keys=True, default=_default) +
+                '\n').encode('utf-8')
+    return (json.dumps(data, separators=(',', ':'), sort_keys=True, default=_default) + '\n').encode('utf-8')
+
+
+def encode_json_orjson(data, pretty=False):
+    if not pretty:
+        encoded = orjson.dumps(data, default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        # jsonify escapes non-ASCII characters, orjson can not, so such responses take the stdlib path
+        if encoded.isascii():
+            return encoded
+    return encode_json_stdlib(data, pretty)
+
+
+ENCODERS = {'stdlib': encode_json_stdlib}
+if orjson is not None:
+    ENCODERS['orjson'] = encode_json_orjson
+encode_json_impl = ENCODERS.get('orjson', encode_json_stdlib)
+
+
+def use_encoder(name):
+    """Switch the JSON encoder, 'orjson' is used by default when it is installed"""
+    global encode_json_impl
+    encode_json_impl = ENCODERS[name]
+
+
+def encode_json(data, pretty=False):
+    """Encode data byte for byte like flask.jsonify, datetimes and dates are written in ISO 8601
+
+    :return: UTF-8 bytes ending in a newline
+    """
+    return encode_json_impl(data, pretty)
+
+
 def output_json(data, code, headers=None):
-    resp = flask.make_response(flask.jsonify(data), code)
-    resp.headers.extend(HEADERS_JSON)
+    if code == 304:
+        resp = flask.make_response('', code)
+    else:
+        app = flask.current_app
+        if not isinstance(data, bytes):
+            data = encode_json(data, app.config['JSONIFY_PRETTYPRINT_REGULAR'] or app.debug)
+        resp = app.response_class(data, code, mimetype=app.config['JSONIFY_MIMETYPE'])
+        resp.headers.extend(HEADERS_JSON)
+    etag = flask.g.get('etag')
+    if etag is not None and code in (200, 304):
+        resp.set_etag(etag)
     if headers is not None:
         resp.headers.extend(headers)
     return resp
-
-
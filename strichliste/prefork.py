@@ -0,0 +1,80 @@
+import os
+import signal
+import socket
+
+from werkzeug.serving import make_server
+
+from strichliste.config import Config
+from strichliste.database import dispose_engines
+from strichliste.flask import reload_config
+
+
+class PreforkServer:
+    """Serve the app from several forked worker processes sharing one listening socket
+
+    The config is loaded and validated once in the master before forking. SIGHUP makes the master and every
+    worker reload it in place, requests in flight finish with the config they started with. Workers that die
+    are replaced, SIGTERM and SIGINT shut everything down.
+    """
+
+    def __init__(self, app, config_path):
+        self.app = app
+        self.config_path = config_path
+        self.workers = {}
+        self.running = False
+        self.socket = None
+
+    def run(self):
+        config = Config()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((config.host, config.port))
+        self.socket.listen(128)
+        # connections opened by the master, e.g. for migrations, must not be shared with the workers
+        dispose_engines(self.app)
+
+        self.running = True
+        signal.signal(signal.SIGHUP, self.reload)
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for x in range(config.workers):
+            self.spawn()
+        self.app.logger.info("Serving on {}:{} with {} workers".format(config.host, config.port, config.workers))
+
+        while self.workers:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            self.workers.pop(pid, None)
+            if self.running:
+                self.app.logger.warning("Worker {} exited with status {}, restarting it".format(pid, status))
+                self.spawn()
+        self.socket.close()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = True
+            return
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_config(self.app, self.config_path))
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        config = Config()
+        server = make_server(config.host, config.port, self.app, threaded=True, fd=self.socket.fileno())
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+
+    def reload(self, signum, frame):
+        reload_config(self.app, self.config_path)
+        for pid in self.workers:
+            os.kill(pid, signal.SIGHUP)
+
+    def stop(self, signum, frame):
+        self.running = False
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
@@ -0,0 +1,201 @@
+import bisect
+import datetime
+import itertools
+import threading
+
+import sqlalchemy as sa
+
+from strichliste.database import db
+from strichliste.models import Transaction, User
+
+# longest activity window, per-day transaction counts older than this are dropped
+MAX_WINDOW_DAYS = 31
+RANKINGS = ('balance', 'activity')
+
+
+class RankingIndex:
+    """Users kept sorted by balance and by their number of transactions in the last days
+
+    Built from the database once per process and then kept current by the transactions and users this process
+    writes. sync picks up what other processes wrote, everything is applied in id order exactly once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last_transaction_id = 0
+        self.last_user_id = 0
+        self.names = {}
+        self.balances = {}
+        # (balance, -user id) ascending, so that read backwards equal balances are in user id order
+        self.by_balance = []
+        # user id: {date: transaction count}
+        self.days = {}
+        # window in days: [(-count, user id)] of the users active within the window, most active first
+        self.by_activity = {}
+        self.today = None
+
+    def build(self):
+        """Load the index, a read transaction keeps balances and the last transaction id consistent"""
+        connection = db.session.connection()
+        if connection.dialect.name == 'sqlite' and not connection.connection.in_transaction:
+            connection.execute('BEGIN')
+        try:
+            self.today = datetime.datetime.utcnow().date()
+            first_day = self.today - datetime.timedelta(days=MAX_WINDOW_DAYS - 1)
+            for user_id, name, balance in db.session.query(User.id, User.name, User.balance):
+                self.names[user_id] = name
+                self.balances[user_id] = balance
+                self.last_user_id = max(self.last_user_id, user_id)
+            self.by_balance = sorted((balance, -user_id) for user_id, balance in self.balances.items())
+
+            day = sa.func.date(Transaction.createDate)
+            query = db.session.query(Transaction.userId, day, sa.func.count(Transaction.id)).filter(
+                Transaction.createDate >= datetime.datetime.combine(first_day, datetime.time())).group_by(
+                Transaction.userId, day)
+            for user_id, date, count in query:
+                if not isinstance(date, datetime.date):
+                    date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+                self.days.setdefault(user_id, {})[date] = count
+            self.last_transaction_id = db.session.query(sa.func.max(Transaction.id)).scalar() or 0
+        finally:
+            db.session.rollback()
+
+    def _roll(self, today):
+        """Forget the days that left every window, the activity rankings are rebuilt on demand"""
+        self.today = today
+        first_day = today - datetime.timedelta(days=MAX_WINDOW_DAYS - 1)
+        for user_id, days in list(self.days.items()):
+            for date in [x for x in days if x < first_day]:
+                del days[date]
+            if not days:
+                del self.days[user_id]
+        self.by_activity.clear()
+
+    def _count(self, user_id, window):
+        first_day = self.today - datetime.timedelta(days=window - 1)
+        return sum(count for date, count in self.days.get(user_id, {}).items() if date >= first_day)
+
+    def _activity(self, window):
+        ranking = self.by_activity.get(window)
+        if ranking is None:
+            counts = ((self._count(user_id, window), user_id) for user_id in self.days)
+            ranking = self.by_activity[window] = sorted((-count, user_id) for count, user_id in counts if count)
+        return ranking
+
+    def _add_user(self, user_id, name, balance):
+        self.names[user_id] = name
+        self.balances[user_id] = balance
+        bisect.insort(self.by_balance, (balance, -user_id))
+        self.last_user_id = user_id
+
+    def _apply(self, transaction_id, user_id, value, create_date):
+        balance = self.balances[user_id]
+        del self.by_balance[bisect.bisect_left(self.by_balance, (balance, -user_id))]
+        self.balances[user_id] = balance + value
+        bisect.insort(self.by_balance, (balance + value, -user_id))
+        self.last_transaction_id = transaction_id
+
+        date = create_date.date()
+        if date > self.today:
+            self._roll(date)
+        if date <= self.today - datetime.timedelta(days=MAX_WINDOW_DAYS):
+            return
+        for window, ranking in self.by_activity.items():
+            if date <= self.today - datetime.timedelta(days=window):
+                continue
+            count = self._count(user_id, window)
+            if count:
+                del ranking[bisect.bisect_left(ranking, (-count, user_id))]
+            bisect.insort(ranking, (-count - 1, user_id))
+        days = self.days.setdefault(user_id, {})
+        days[date] = days.get(date, 0) + 1
+
+    def add_user(self, user_id, name):
+        with self._lock:
+            if user_id == self.last_user_id + 1:
+                self._add_user(user_id, name, 0)
+
+    def add_transactions(self, transactions):
+        """Apply transactions this process just committed
+
+        Anything that does not directly follow what the index has seen is left to sync, so a transaction of
+        another process in between is not skipped.
+
+        :param transactions: Iterable of (id, user_id, value, create_date) in id order
+        """
+        with self._lock:
+            for transaction_id, user_id, value, create_date in transactions:
+                if transaction_id != self.last_transaction_id + 1 or user_id not in self.balances:
+                    return
+                self._apply(transaction_id, user_id, value, create_date)
+
+    def sync(self):
+        """Apply the users and transactions written since, by this or any other process"""
+        with self._lock:
+            for user_id, name, balance in db.session.query(User.id, User.name, User.balance).filter(
+                    User.id > self.last_user_id).order_by(User.id):
+                # the balance may already include transactions past last_transaction_id, start from zero instead
+                self._add_user(user_id, name, 0)
+            for row in db.session.query(Transaction.id, Transaction.userId, Transaction.value,
+                                        Transaction.createDate).filter(
+                    Transaction.id > self.last_transaction_id).order_by(Transaction.id):
+                if row[1] not in self.balances:
+                    # its user was created after the users were read, the next sync continues here
+                    break
+                self._apply(*row)
+
+    def top(self, by, limit, window=None, descending=True):
+        """Read the first limit entries of a ranking
+
+        :param by: 'balance' or 'activity'
+        :param window: Activity window in days, at most MAX_WINDOW_DAYS
+        :param descending: Highest balance or most transactions first, otherwise the lowest first
+        :return: Entry dicts with rank, id, name, balance and countTransactions in the window for activity
+        """
+        with self._lock:
+            today = datetime.datetime.utcnow().date()
+            if today > self.today:
+                self._roll(today)
+            if by == 'balance':
+                entries = last(self.by_balance, limit) if descending else self.by_balance[:limit]
+                return [{'rank': rank, 'id': -negative_id, 'name': self.names[-negative_id], 'balance': balance}
+                        for rank, (balance, negative_id) in enumerate(entries, 1)]
+            ranking = self._activity(window)
+            entries = ranking[:limit] if descending else last(ranking, limit)
+            return [{'rank': rank, 'id': user_id, 'name': self.names[user_id], 'balance': self.balances[user_id],
+                     'countTransactions': -count}
+                    for rank, (count, user_id) in enumerate(entries, 1)]
+
+
+def last(ranking, limit):
+    """The last limit entries in reverse, without copying the rest of the list"""
+    return list(itertools.islice(reversed(ranking), limit))
+
+
+_lock = threading.Lock()
+
+
+def get_index(app):
+    """The app's index, built on first use"""
+    index = app.extensions.get('ranking')
+    if index is None:
+        with _lock:
+            index = app.extensions.get('ranking')
+            if index is None:
+                index = RankingIndex()
+                index.build()
+                app.extensions['ranking'] = index
+    return index
+
+
+def note_transactions(app, transactions):
+    """Feed committed transactions to the app's index, if it was built already"""
+    index = app.extensions.get('ranking')
+    if index is not None:
+        index.add_transactions(transactions)
+
+
+def note_user(app, user_id, name):
+    index = app.extensions.get('ranking')
+    if index is not None:
+        index.add_user(user_id, name)
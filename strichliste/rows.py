@@ -0,0 +1,55 @@
+import sqlalchemy as sa
+
+from strichliste.database import db
+from strichliste.models import ArchiveCarry, Transaction, User
+
+
+class TransactionRow:
+    """Read-only transaction record, built from a column tuple without ORM instrumentation or identity map"""
+    __slots__ = ('id', 'userId', 'value', 'createDate')
+    columns = (Transaction.id, Transaction.userId, Transaction.value, Transaction.createDate)
+
+    def __init__(self, id, userId, value, createDate):
+        self.id = id
+        self.userId = userId
+        self.value = value
+        self.createDate = createDate
+
+    def dict(self):
+        return {'id': self.id, 'userId': self.userId, 'value': self.value, 'createDate': self.createDate}
+
+
+class UserRow:
+    """Read-only user record for lists, lastTransaction comes from correlated subqueries
+
+    Users whose transactions are all archived fall back to the date kept in archive_carry.
+    """
+    __slots__ = ('id', 'name', 'balance', 'lastTransaction')
+    columns = (User.id, User.name, User.balance,
+               sa.func.coalesce(
+                   sa.select([sa.func.max(Transaction.createDate)]).where(Transaction.userId == User.id).as_scalar(),
+                   sa.select([ArchiveCarry.lastTransaction]).where(ArchiveCarry.userId == User.id).as_scalar()))
+
+    def __init__(self, id, name, balance, lastTransaction):
+        self.id = id
+        self.name = name
+        self.balance = balance
+        self.lastTransaction = lastTransaction
+
+    def dict(self):
+        return {'id': self.id, 'name': self.name, 'balance': self.balance, 'lastTransaction': self.lastTransaction}
+
+
+def row_query(row_class, source=None):
+    """Query selecting the columns of a row class, filter and order it like any other query
+
+    :param source: Table or alias to select the columns from by name, e.g. archive.ledger_source()
+    """
+    if source is None:
+        return db.session.query(*row_class.columns)
+    return db.session.query(*(source.c[x] for x in row_class.__slots__))
+
+
+def fetch_rows(row_class, query):
+    """Run a row_query and build records straight from the result tuples, skipping the ORM loading step"""
+    return [row_class(*x) for x in db.session.execute(query.statement)]
@@ -1,11 +1,15 @@
+import functools
 from datetime import datetime, timedelta
 
-from flask import current_app
-from flask_restful import Resource, reqparse
+from flask import Response, current_app, g, request
+from flask_restful import Resource, inputs, reqparse
 from werkzeug.exceptions import BadRequest
 
-from strichliste import middleware, models
+from strichliste import export, middleware, models, ranking
+from strichliste.cache import cached, response_cache
 from strichliste.config import Config
+from strichliste.events import broker
+from strichliste.instrumentation import instrumentation
 
 user_parser = reqparse.RequestParser()
 user_parser.add_argument('name', type=str, location='json')
@@ -18,6 +22,42 @@ list_parser = reqparse.RequestParser()
 list_parser.add_argument('offset', type=int, location='args', default=None)
 list_parser.add_argument('limit', type=int, location='args', default=None)
 
+transaction_list_parser = list_parser.copy()
+transaction_list_parser.add_argument('after_id', type=int, location='args', default=None)
+transaction_list_parser.add_argument('before_id', type=int, location='args', default=None)
+transaction_list_parser.add_argument('count', type=inputs.boolean, location='args', default=None)
+
+export_parser = reqparse.RequestParser()
+export_parser.add_argument('format', location='args', default='ndjson', choices=tuple(export.EXPORT_FORMATS))
+export_parser.add_argument('from', type=inputs.date, location='args', dest='start', default=None)
+export_parser.add_argument('to', type=inputs.date, location='args', dest='end', default=None)
+export_parser.add_argument('userId', type=int, location='args', dest='user_id', default=None)
+
+user_get_parser = reqparse.RequestParser()
+user_get_parser.add_argument('transactions_limit', type=int, location='args', default=None)
+
+ranking_parser = reqparse.RequestParser()
+ranking_parser.add_argument('by', location='args', default='balance', choices=ranking.RANKINGS)
+ranking_parser.add_argument('window', type=int, location='args', default=7)
+ranking_parser.add_argument('limit', type=int, location='args', default=10)
+ranking_parser.add_argument('order', location='args', default='desc', choices=('desc', 'asc'))
+
+metrics_parser = reqparse.RequestParser()
+metrics_parser.add_argument('days', type=int, location='args', default=4)
+
+MAX_METRICS_DAYS = 366
+MAX_EMBEDDED_TRANSACTIONS = 1000
+MAX_RANKING_LIMIT = 1000
+
+TRANSACTION_ERRORS = [
+    (middleware.TransactionValueZero, 400, 'valueZero'),
+    (middleware.TransactionValueHigh, 403, 'valueHigh'),
+    (middleware.TransactionValueLow, 403, 'valueLow'),
+    (middleware.TransactionResultHigh, 403, 'accountHigh'),
+    (middleware.TransactionResultLow, 403, 'accountLow'),
+    (KeyError, 404, 'userNotFound'),
+]
+
 HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
 
 
@@ -31,7 +71,34 @@ def make_error_response(msg, code: int = 400):
     return {'message': str(msg)}, code
 
 
+def versioned(daily=False):
+    """Answer conditional GETs from the ledger version alone
+
+    The ETag is derived from the global ledger version, or from the user's version for routes with a user_id.
+    A matching If-None-Match short-circuits to 304 before the resource runs any other query.
+
+    :param daily: Also change the ETag at midnight UTC, for responses that depend on the current date
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            user_id = kwargs.get('user_id')
+            version = middleware.get_ledger_version(user_id)
+            if version is None:
+                return func(self, *args, **kwargs)
+            etag = 'user-{}-{}'.format(user_id, version) if user_id is not None else 'ledger-{}'.format(version)
+            if daily:
+                etag += '-' + datetime.utcnow().date().isoformat()
+            g.etag = etag
+            if request.if_none_match.contains(etag):
+                return None, 304
+            return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class Settings(Resource):
+    @cached('settings')
     def get(self):
         config = Config()
         return {'boundaries': {'account': {'upper': config.upper_account_boundary,
@@ -42,26 +109,42 @@ class Settings(Resource):
                 }, 200
 
 
+class CacheStats(Resource):
+    def get(self):
+        return response_cache.stats(), 200
+
+
+class InternalStats(Resource):
+    def get(self):
+        if 'instrumentation' not in current_app.extensions:
+            return make_error_response("instrumentation is disabled, enable it in the [instrumentation] section", 404)
+        return {'endpoints': instrumentation.stats(), 'cache': response_cache.stats()}, 200
+
+
 class Metrics(Resource):
+    @versioned(daily=True)
+    @cached('metrics')
     def get(self):
+        days = metrics_parser.parse_args()['days']
+        if days is None or not 1 <= days <= MAX_METRICS_DAYS:
+            return make_error_response("days must be between 1 and {}".format(MAX_METRICS_DAYS), 400)
         today = datetime.utcnow().date()
         data = dict(today=today.isoformat())
 
-        data['countTransactions'] = models.Transaction.query.count()
-        data['overallBalance'] = middleware.get_global_balance()
-        data['countUsers'] = models.User.query.count()
-        data['avgBalance'] = middleware.get_average_balance()
-        data['days'] = [middleware.get_day_metrics(today - timedelta(days=x)) for x in range(3, -1, -1)]
+        data.update(middleware.get_global_metrics())
+        data['days'] = middleware.get_days_metrics(today - timedelta(days=days - 1), days)
         return data, 200
 
 
 class UserTransaction(Resource):
+    @versioned()
+    @cached('user:{user_id}')
     def get(self, user_id, transaction_id):
         user = models.User.query.get(user_id)
         if user is None:
             current_app.logger.warning("Could not find transaction: User ID not found - user_id='{}'".format(user_id))
             return make_error_response("user {} not found".format(user_id), 404)
-        transaction = models.Transaction.query.get(transaction_id)
+        transaction = middleware.get_transaction(transaction_id)
         if transaction is None or transaction.userId != user.id:
             current_app.logger.warning(("Could not find transaction: User ID does not match - "
                                         "user_id='{}', transaction_id='{}'").format(user_id, transaction_id))
@@ -70,18 +153,91 @@ class UserTransaction(Resource):
 
 
 class Transaction(Resource):
+    @versioned()
+    @cached('transactions')
     def get(self):
-        args = list_parser.parse_args()
-        limit = args.get('limit')
-        offset = args.get('offset')
-        count = models.Transaction.query.count()
-        result = models.Transaction.query.offset(offset).limit(limit).all()
-        entries = [x.dict() for x in result]
-        return {'overallCount': count, 'limit': limit,
-                'offset': offset, 'entries': entries}, 200
+        args = transaction_list_parser.parse_args()
+        if args['after_id'] is not None and args['before_id'] is not None:
+            return make_error_response("after_id and before_id can not be combined", 400)
+        transactions = middleware.get_transactions(**args)
+        return transactions, 200
+
+
+def batch_item_result(item, error):
+    if error is None:
+        return {'userId': item[0], 'value': item[1], 'status': 200, 'code': 'ok'}
+    for exception, status, code in TRANSACTION_ERRORS:
+        if isinstance(error, exception):
+            break
+    else:
+        status, code = 400, 'invalid'
+    message = "user {} not found".format(item[0]) if isinstance(error, KeyError) else str(error)
+    return {'userId': item[0], 'value': item[1], 'status': status, 'code': code, 'message': message}
+
+
+class TransactionBatch(Resource):
+    def post(self):
+        body = request.get_json(silent=True)
+        entries = body.get('transactions') if isinstance(body, dict) else None
+        if not isinstance(entries, list) or not entries:
+            current_app.logger.warning("Could not create transactions: Invalid input")
+            return make_error_response("transactions missing", 400)
+        max_size = Config().max_batch_size
+        if len(entries) > max_size:
+            current_app.logger.warning("Could not create transactions: Batch too large")
+            return make_error_response("batch exceeds the maximum of {} transactions".format(max_size), 400)
+
+        items = []
+        for entry in entries:
+            if not isinstance(entry, dict):
+                return make_error_response("Error parsing json", 400)
+            user_id, value = entry.get('userId'), entry.get('value')
+            if type(user_id) is not int or type(value) is not int:
+                current_app.logger.warning("Could not create transactions: Invalid input")
+                return make_error_response("Error parsing json", 400)
+            items.append((user_id, value))
+
+        try:
+            transactions = middleware.insert_transactions(items)
+        except middleware.BatchRejected as e:
+            current_app.logger.warning("Could not create transactions: Batch rejected")
+            return {'message': "batch rejected, no transactions were created",
+                    'results': [batch_item_result(item, error) for item, error in zip(items, e.results)]}, 400
+        except middleware.DatabaseError as e:
+            current_app.logger.error("Could not create transactions: {e} - count='{count}'".format(
+                e=e, count=len(items)))
+            return make_error_response("Database Error", 403)
+        current_app.logger.info("Transactions created - count='{}'".format(len(transactions)))
+        return {'entries': transactions}, 201
+
+
+class TransactionExport(Resource):
+    def get(self):
+        args = export_parser.parse_args()
+        if args['user_id'] is not None and models.User.query.get(args['user_id']) is None:
+            current_app.logger.warning("Could not export transactions: User ID not found - user_id='{}'".format(
+                args['user_id']))
+            return make_error_response("user {} not found".format(args['user_id']), 404)
+        # 'to' is inclusive, include the whole day
+        end = args['end'] + timedelta(days=1) if args['end'] is not None else None
+        chunks = export.export_transactions(args['format'], args['start'], end, args['user_id'])
+        mimetype = export.EXPORT_FORMATS[args['format']][1]
+        return Response(chunks, mimetype=mimetype, headers={
+            'Content-Disposition': 'attachment; filename="transactions.{}"'.format(args['format'])})
+
+
+class TransactionStream(Resource):
+    def get(self):
+        broker.start(current_app._get_current_object())
+        last_event_id = request.headers.get('Last-Event-ID', type=int)
+        return Response(broker.subscribe(Config().stream_keepalive, last_event_id),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 class UserList(Resource):
+    @versioned()
+    @cached('users')
     def get(self):
         args = list_parser.parse_args()
         limit = args.get('limit')
@@ -108,22 +264,43 @@ class UserList(Resource):
                 'balance': 0, 'lastTransaction': None}, 201
 
 
+class UserRanking(Resource):
+    def get(self):
+        args = ranking_parser.parse_args()
+        if not 1 <= args['limit'] <= MAX_RANKING_LIMIT:
+            return make_error_response("limit must be between 1 and {}".format(MAX_RANKING_LIMIT), 400)
+        if not 1 <= args['window'] <= ranking.MAX_WINDOW_DAYS:
+            return make_error_response("window must be between 1 and {}".format(ranking.MAX_WINDOW_DAYS), 400)
+        window = args['window'] if args['by'] == 'activity' else None
+        entries = middleware.get_ranking(args['by'], args['limit'], window, args['order'] == 'desc')
+        return {'by': args['by'], 'window': window, 'order': args['order'], 'limit': args['limit'],
+                'entries': entries}, 200
+
+
 class User(Resource):
+    @versioned()
+    @cached('user:{user_id}')
     def get(self, user_id):
+        transactions_limit = user_get_parser.parse_args()['transactions_limit']
+        if transactions_limit is not None and not 0 <= transactions_limit <= MAX_EMBEDDED_TRANSACTIONS:
+            return make_error_response(
+                "transactions_limit must be between 0 and {}".format(MAX_EMBEDDED_TRANSACTIONS), 400)
         try:
-            user = middleware.get_user(user_id)
+            user = middleware.get_user(user_id, transactions_limit)
             return user, 200
         except KeyError:
             return make_error_response("user {} not found".format(user_id), 404)
 
 
 class UserTransactionList(Resource):
+    @versioned()
+    @cached('user:{user_id}')
     def get(self, user_id):
-        args = list_parser.parse_args()
-        limit = args.get('limit')
-        offset = args.get('offset')
+        args = transaction_list_parser.parse_args()
+        if args['after_id'] is not None and args['before_id'] is not None:
+            return make_error_response("after_id and before_id can not be combined", 400)
         try:
-            transactions = middleware.get_users_transactions(user_id, limit=limit, offset=offset)
+            transactions = middleware.get_users_transactions(user_id, **args)
         except KeyError:
             current_app.logger.warning("User ID not found - user_id='{}'".format(user_id))
             return make_error_response("user {} not found".format(user_id), 404)
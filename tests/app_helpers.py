@@ -0,0 +1,17 @@
+from strichliste import migrations
+from strichliste.config import write_config
+from strichliste.flask import create_api, create_app
+
+
+def make_app(config_path=None, **sections):
+    """Create an in-process app with all resources registered and the schema migrated
+
+    :param config_path: Existing config file, a fresh one is written from sections otherwise
+    """
+    if config_path is None:
+        config_path = write_config(**sections)
+    app = create_app(config_path)
+    create_api(app)
+    with app.app_context():
+        migrations.migrate()
+    return app
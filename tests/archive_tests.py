@@ -0,0 +1,76 @@
+import datetime
+import json
+
+import pytest
+import sqlalchemy as sa
+
+from strichliste import archive, importer, middleware, models
+from strichliste.database import db
+
+from app_helpers import make_app
+
+
+def seed(app):
+    """alice has transactions in 2019, 2020 and 2021, bob only in 2019"""
+    users = [{'id': 1, 'name': 'alice', 'mailAddress': '', 'createDate': datetime.datetime(2019, 1, 1), 'active': 1},
+             {'id': 2, 'name': 'bob', 'mailAddress': '', 'createDate': datetime.datetime(2019, 1, 1), 'active': 1}]
+    dates = [(1, '2019-05-01T10:00:00'), (2, '2019-06-01T10:00:00'), (1, '2020-02-01T10:00:00'),
+             (1, '2020-12-31T23:00:00'), (1, '2021-03-01T10:00:00'), (1, '2021-03-02T10:00:00')]
+    transactions = [importer.transaction_row({'id': x + 1, 'userId': user_id, 'value': (x + 1) * 100,
+                                              'createDate': date})
+                    for x, (user_id, date) in enumerate(dates)]
+    with app.app_context():
+        importer.import_ledger(users, transactions)
+
+
+def snapshot(client):
+    return {'metrics': json.loads(client.get('/metrics', query_string={'days': 1}).data),
+            'users': json.loads(client.get('/user').data)['entries'],
+            'alice': json.loads(client.get('/user/1', query_string={'transactions_limit': 10}).data),
+            'bob': json.loads(client.get('/user/2').data),
+            'alice_transactions': json.loads(client.get('/user/1/transaction').data)['entries'],
+            'transactions': json.loads(client.get('/transaction').data)['entries'],
+            'export': client.get('/transaction/export').data}
+
+
+def test_archive_reads_stay_the_same():
+    app = make_app(cache={'enabled': 'no'})
+    seed(app)
+    client = app.test_client()
+    before = snapshot(client)
+
+    with app.app_context():
+        assert archive.archive_transactions(datetime.date(2021, 1, 1)) == 4
+        assert archive.archive_years() == [2019, 2020]
+        assert [x.id for x in models.Transaction.query.order_by(models.Transaction.id)] == [5, 6]
+        archived = db.session.execute(sa.select([archive.archive_table(2020).c.id])).fetchall()
+        assert [x[0] for x in archived] == [3, 4]
+        carry = {x.userId: (x.balance, x.transactionCount) for x in models.ArchiveCarry.query}
+        assert carry == {1: (100 + 300 + 400, 3), 2: (200, 1)}
+
+    assert snapshot(client) == before
+    r = client.get('/user/2/transaction/2')
+    assert r.status_code == 200
+    assert json.loads(r.data)['value'] == 200
+    page = json.loads(client.get('/user/1/transaction', query_string={'limit': 2, 'after_id': 1}).data)
+    assert [x['id'] for x in page['entries']] == [3, 4]
+
+    with app.app_context():
+        assert middleware.reconcile_balances() == []
+        middleware.backfill_rollups()
+    assert snapshot(client) == before
+
+    r = client.post('/user/2/transaction', json={'value': 50})
+    assert json.loads(r.data)['id'] == 7
+    assert json.loads(client.get('/user/2').data)['balance'] == 250
+
+
+def test_archive_keeps_the_newest_transaction():
+    app = make_app()
+    seed(app)
+    with app.app_context():
+        assert archive.archive_transactions(datetime.date(2022, 1, 1)) == 5
+        assert [x.id for x in models.Transaction.query] == [6]
+        assert archive.archive_transactions(datetime.date(2022, 1, 1)) == 0
+        with pytest.raises(ValueError):
+            archive.archive_transactions(datetime.datetime.utcnow().date() + datetime.timedelta(days=1))
@@ -0,0 +1,30 @@
+import asyncio
+
+from strichliste.asgi import STREAM_PATH, AsgiApp
+
+from app_helpers import make_app
+
+
+def test_stream_client_disconnects():
+    asgi_app = AsgiApp(make_app())
+    scope = {'type': 'http', 'method': 'GET', 'path': STREAM_PATH, 'query_string': b'', 'headers': [],
+             'http_version': '1.1'}
+    sent = []
+
+    async def run():
+        first_frame = asyncio.Event()
+
+        async def receive():
+            await first_frame.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if message['type'] == 'http.response.body':
+                first_frame.set()
+
+        await asyncio.wait_for(asgi_app(scope, receive, send), 10)
+
+    asyncio.run(run())
+    assert sent[0]['status'] == 200
+    assert sent[1]['body'].startswith(b'retry:')
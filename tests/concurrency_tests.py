@@ -0,0 +1,119 @@
+import multiprocessing
+import random
+import threading
+
+import sqlalchemy as sa
+
+from strichliste import middleware, models
+from strichliste.database import db
+
+from app_helpers import make_app, write_config
+
+WORKERS = 6
+ATTEMPTS = 60
+LOWER = -1000
+UPPER = 1000
+
+
+def hammer(config_path, seed):
+    app = make_app(config_path)
+    rng = random.Random(seed)
+    created = 0
+    with app.app_context():
+        for x in range(ATTEMPTS):
+            try:
+                if rng.random() < 0.2:
+                    middleware.insert_transactions([(1, rng.randint(-400, 400) or 1) for y in range(3)])
+                else:
+                    middleware.insert_transaction(1, rng.randint(-600, 600) or 1)
+                created += 1
+            except (middleware.TransactionResultLimit, middleware.BatchRejected):
+                pass
+            finally:
+                db.session.remove()
+    return created
+
+
+def test_parallel_writers_respect_account_limits():
+    config_path = write_config(limits={'account_lower': LOWER // 100, 'account_upper': UPPER // 100},
+                               database={'write_attempts': 20})
+    app = make_app(config_path)
+    with app.app_context():
+        middleware.insert_user('shared')
+
+    with multiprocessing.get_context('spawn').Pool(WORKERS) as pool:
+        created = sum(pool.starmap(hammer, [(config_path, x) for x in range(WORKERS)]))
+
+    with app.app_context():
+        values = [x for x, in db.session.query(models.Transaction.value).order_by(models.Transaction.id)]
+        balance = db.session.query(models.User.balance).filter(models.User.id == 1).scalar()
+        counters = middleware.get_counters()
+    assert created > 0
+    running = 0
+    for value in values:
+        running += value
+        assert LOWER <= running <= UPPER
+    assert balance == running
+    assert counters[middleware.COUNTER_BALANCE] == running
+    assert counters[middleware.COUNTER_TRANSACTIONS] == len(values)
+
+
+def test_group_commit_shares_commits_and_respects_pending_amounts():
+    config_path = write_config(limits={'account_lower': LOWER // 100, 'account_upper': UPPER // 100},
+                               database={'group_commit': 'yes', 'group_commit_interval_ms': 20})
+    app = make_app(config_path)
+    with app.app_context():
+        middleware.insert_user('shared')
+        engine = db.engine
+    commits = []
+    results = []
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    def buyer():
+        # every request alone would fit the account, together they exceed it
+        response = app.test_client().post('/user/1/transaction', json={'value': 300})
+        results.append((response.status_code, response.get_json()))
+
+    sa.event.listen(engine, 'commit', on_commit)
+    try:
+        threads = [threading.Thread(target=buyer) for x in range(WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sa.event.remove(engine, 'commit', on_commit)
+
+    created = [body for status, body in results if status == 201]
+    assert len(created) == UPPER // 300
+    assert sorted(x['id'] for x in created) == list(range(1, len(created) + 1))
+    assert all(status == 403 and body['message'] for status, body in results if status != 201)
+    assert len(commits) < len(created)
+    with app.app_context():
+        assert db.session.query(models.User.balance).filter(models.User.id == 1).scalar() == 300 * len(created)
+        assert middleware.reconcile_balances() == []
+
+
+def test_writers_lock_the_write_lock_row_without_begin_immediate(monkeypatch):
+    app = make_app()
+    with app.app_context():
+        user_id = middleware.insert_user('shared').id
+        engine = db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    # the SQLite compiler drops FOR UPDATE, what is left shows the lock row is read first
+    monkeypatch.setattr(engine.dialect, 'name', 'postgresql')
+    sa.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        with app.app_context():
+            transactions = middleware.insert_transactions([(user_id, 100), (user_id, -50)])
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert [x['id'] for x in transactions] == [1, 2]
+    assert 'FROM meta' in statements[0][0] and middleware.WRITE_LOCK in statements[0][1]
+    assert not any('BEGIN IMMEDIATE' in statement for statement, parameters in statements)
@@ -0,0 +1,40 @@
+import pytest
+
+from strichliste.config import Config, ConfigError
+from strichliste.flask import LOG_HANDLERS, reload_config
+
+from app_helpers import make_app, write_config
+
+
+def test_config_is_immutable():
+    config = Config(write_config(limits={'account_upper': 42}))
+    assert Config() is config
+    assert config.upper_account_boundary == 4200
+    with pytest.raises(AttributeError):
+        config.upper_account_boundary = 0
+    with pytest.raises(AttributeError):
+        config.unknown_option = 0
+
+
+def test_invalid_config_is_rejected():
+    with pytest.raises(ConfigError):
+        Config(write_config(limits={'account_upper': -5, 'account_lower': 5}))
+    with pytest.raises(ConfigError):
+        Config(write_config(database={'journal_mode': 'fast'}))
+
+
+def test_reload_keeps_previous_config_on_error():
+    config_path = write_config(limits={'account_upper': 42})
+    app = make_app(config_path)
+    old = Config()
+    with open(config_path, 'a') as config_file:
+        config_file.write('[cache]\nsize = many\n')
+    assert reload_config(app, config_path) is old
+    assert Config() is old
+
+
+def test_apps_share_one_set_of_log_handlers():
+    make_app()
+    app = make_app()
+    names = [x.get_name() for x in app.logger.handlers]
+    assert sorted(x for x in names if x in LOG_HANDLERS) == sorted(LOG_HANDLERS)
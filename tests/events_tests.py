@@ -0,0 +1,21 @@
+import json
+
+from strichliste import events, middleware
+
+from app_helpers import make_app
+
+
+def test_replay_is_capped_at_the_buffer():
+    app = make_app(stream={'buffer': 5})
+    with app.app_context():
+        middleware.insert_user('alice')
+        middleware.insert_transactions([(1, 100)] * 20)
+    broker = events.TransactionBroker()
+    broker.start(app)
+
+    frames = broker.replay(0, 20)
+    ids = [int(x.split(b'\n')[0][len(b'id: '):]) for x in frames]
+    assert ids == [16, 17, 18, 19, 20]
+    last = json.loads(frames[-1].split(b'data: ')[1])
+    assert (last['countTransactions'], last['overallBalance']) == (20, 2000)
+    assert json.loads(frames[0].split(b'data: ')[1])['countTransactions'] == 16
@@ -0,0 +1,76 @@
+import json
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from strichliste import importer, middleware, models
+from strichliste.database import db
+
+from app_helpers import make_app
+
+
+def write_strichliste_db():
+    """Database in the schema of the original Strichliste, values are euros"""
+    path = os.path.join(tempfile.mkdtemp(prefix='strichliste-import-'), 'strichliste.sqlite')
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE,
+                            mailAddress TEXT, createDate DATETIME DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, userId INTEGER NOT NULL,
+                                   createDate DATETIME DEFAULT CURRENT_TIMESTAMP, value FLOAT);
+        INSERT INTO users (id, name, mailAddress, createDate) VALUES (1, 'alice', NULL, '2015-03-01 10:00:00'),
+                                                                      (3, 'bob', 'bob@example.org', '2015-03-01 11:00:00');
+        INSERT INTO transactions (id, userId, createDate, value) VALUES (1, 1, '2015-03-01 12:00:00', 10.0),
+                                                                        (2, 1, '2015-03-01 12:30:00', -1.5),
+                                                                        (3, 3, '2015-03-02 09:00:00', 2.2),
+                                                                        (7, 3, '2015-03-02 09:05:00', -0.7);
+    """)
+    connection.commit()
+    connection.close()
+    return path
+
+
+def test_import_strichliste_db():
+    app = make_app()
+    with app.app_context():
+        users, transactions = importer.read_strichliste_db(write_strichliste_db())
+        assert importer.import_ledger(users, transactions, batch_size=3)[:2] == (2, 4)
+        assert middleware.reconcile_balances() == []
+        assert dict(db.session.query(models.User.id, models.User.balance)) == {1: 850, 3: 150}
+        assert [x.value for x in models.Transaction.query.order_by(models.Transaction.id)] == [1000, -150, 220, -70]
+
+    client = app.test_client()
+    metrics = json.loads(client.get('/metrics').data)
+    assert metrics['countTransactions'] == 4
+    assert metrics['countUsers'] == 2
+    assert metrics['overallBalance'] == 1000
+    r = client.post('/user/3/transaction', json={'value': 100})
+    assert json.loads(r.data)['id'] == 8
+    assert json.loads(client.get('/user/3').data)['balance'] == 250
+
+
+def test_import_files_rejects_orphans():
+    directory = tempfile.mkdtemp(prefix='strichliste-import-')
+    users_path = os.path.join(directory, 'users.csv')
+    transactions_path = os.path.join(directory, 'transactions.ndjson')
+    with open(users_path, 'w') as users_file:
+        users_file.write('id,name,mailAddress,createDate\n1,alice,,2020-01-01T00:00:00\n')
+    with open(transactions_path, 'w') as transactions_file:
+        transactions_file.write('{"id": 1, "userId": 1, "value": 500, "createDate": "2020-01-02T00:00:00"}\n')
+        transactions_file.write('{"id": 2, "userId": 2, "value": 500, "createDate": "2020-01-02T00:00:00"}\n')
+
+    app = make_app()
+    with app.app_context():
+        with pytest.raises(importer.ImportRejected):
+            importer.import_ledger(*importer.read_files(users_path, transactions_path))
+        assert models.User.query.count() == 0
+        assert models.Transaction.query.count() == 0
+
+        with open(transactions_path, 'w') as transactions_file:
+            transactions_file.write('{"id": 1, "userId": 1, "value": 500, "createDate": "2020-01-02T00:00:00"}\n')
+        assert importer.import_ledger(*importer.read_files(users_path, transactions_path))[:2] == (1, 1)
+        assert middleware.get_counters()[middleware.COUNTER_BALANCE] == 500
+        with pytest.raises(importer.ImportRejected):
+            importer.import_ledger(*importer.read_files(users_path, transactions_path))
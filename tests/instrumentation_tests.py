@@ -0,0 +1,41 @@
+import json
+import logging
+
+from app_helpers import make_app
+
+
+def test_stats_per_endpoint():
+    app = make_app(instrumentation={'enabled': 'yes', 'slow_request_ms': 0})
+    client = app.test_client()
+    client.post('/user', json={'name': 'gert', 'mailAddress': ''})
+    for x in range(3):
+        client.post('/user/1/transaction', json={'value': 100})
+    client.get('/user/1')
+    client.get('/user/2')
+
+    stats = json.loads(client.get('/internal/stats').data)
+    endpoints = stats['endpoints']
+    assert endpoints['POST /user/<int:user_id>/transaction']['count'] == 3
+    assert endpoints['POST /user/<int:user_id>/transaction']['sqlStatements'] >= 3
+    user = endpoints['GET /user/<int:user_id>']
+    assert user['count'] == 2
+    assert user['responseBytes'] > 0
+    assert sum(user['latencyHistogram']['counts']) == 2
+    assert user['latencyP50Ms'] is not None
+    assert 'hits' in stats['cache']
+
+
+def test_slow_requests_are_logged_with_queries(caplog):
+    app = make_app(instrumentation={'enabled': 'yes', 'slow_request_ms': 0.001})
+    client = app.test_client()
+    with caplog.at_level(logging.WARNING):
+        client.get('/user')
+    slow = [x.getMessage() for x in caplog.records if x.getMessage().startswith('Slow request')]
+    assert len(slow) == 1
+    assert "endpoint='GET /user'" in slow[0]
+    assert 'FROM users' in slow[0]
+
+
+def test_stats_disabled_by_default():
+    app = make_app()
+    assert app.test_client().get('/internal/stats').status_code == 404
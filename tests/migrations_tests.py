@@ -0,0 +1,47 @@
+import json
+import os
+import sqlite3
+
+from strichliste import middleware, migrations
+from strichliste.database import db
+from strichliste.models import Meta
+
+from app_helpers import make_app, write_config
+
+
+def write_baseline_db(path):
+    """Database as created before stored balances, rollups and indexes, with the single userId index"""
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, name TEXT NOT NULL UNIQUE, createDate DATETIME,
+                            active INTEGER NOT NULL, mailAddress TEXT);
+        CREATE TABLE transactions (id INTEGER NOT NULL PRIMARY KEY, userId INTEGER NOT NULL REFERENCES users (id),
+                                   createDate DATETIME, value INTEGER NOT NULL);
+        CREATE INDEX ix_transactions_userId ON transactions (userId);
+        CREATE TABLE meta ("key" TEXT NOT NULL PRIMARY KEY, value TEXT);
+        INSERT INTO users VALUES (1, 'alice', '2020-01-01 00:00:00.000000', 1, ''),
+                                 (2, 'bob', '2020-01-01 00:00:00.000000', 1, '');
+        INSERT INTO transactions VALUES (1, 1, '2020-01-02 10:00:00.000000', 500),
+                                        (2, 1, '2020-01-02 11:00:00.000000', -200),
+                                        (3, 2, '2020-01-03 10:00:00.000000', 100);
+    """)
+    connection.commit()
+    connection.close()
+
+
+def test_migrate_baseline_db():
+    config_path = write_config()
+    write_baseline_db(os.path.join(os.path.dirname(config_path), 'strichliste.db'))
+    app = make_app(config_path)
+    with app.app_context():
+        assert migrations.get_schema_version() == migrations.MIGRATIONS[-1][0]
+        assert [tuple(x) for x in db.session.execute('SELECT id, transactionCount FROM users ORDER BY id')] == [
+            (1, 2), (2, 1)]
+        assert db.session.query(Meta.key).filter(Meta.key == middleware.WRITE_LOCK).scalar() is not None
+
+    client = app.test_client()
+    user = json.loads(client.get('/user/1').data)
+    assert user['balance'] == 300
+    assert user['countTransactions'] == 2
+    metrics = json.loads(client.get('/metrics').data)
+    assert (metrics['countUsers'], metrics['countTransactions'], metrics['overallBalance']) == (2, 3, 400)
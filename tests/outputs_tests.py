@@ -0,0 +1,37 @@
+import datetime
+
+import flask
+import pytest
+
+from strichliste import outputs
+
+from app_helpers import make_app
+
+DATA = {'entries': [{'id': 1, 'userId': 2, 'value': -150, 'createDate': datetime.datetime(2020, 1, 2, 3, 4, 5, 6)},
+                    {'id': 2, 'userId': 2, 'value': 99, 'createDate': datetime.datetime(2020, 1, 2, 3, 4, 5)}],
+        'name': 'jürgen ☃', 'avgBalance': 12.5, 'nextCursor': None, 'active': True}
+
+
+def jsonify_reference(data, debug):
+    converted = dict(data, entries=[dict(x, createDate=x['createDate'].isoformat()) for x in data['entries']])
+    app = make_app()
+    app.debug = debug
+    with app.app_context():
+        return flask.jsonify(converted).get_data()
+
+
+@pytest.mark.parametrize('encoder', sorted(outputs.ENCODERS))
+@pytest.mark.parametrize('debug', [False, True])
+def test_encoders_match_jsonify(encoder, debug):
+    expected = jsonify_reference(DATA, debug)
+    assert outputs.ENCODERS[encoder](DATA, pretty=debug) == expected
+    ascii_only = dict(DATA, name='gert')
+    assert outputs.ENCODERS[encoder](ascii_only, pretty=debug) == jsonify_reference(ascii_only, debug)
+
+
+def test_pre_encoded_bytes_pass_through():
+    app = make_app()
+    with app.test_request_context():
+        resp = outputs.output_json(b'{"id":1}\n', 200)
+    assert resp.get_data() == b'{"id":1}\n'
+    assert resp.mimetype == 'application/json'
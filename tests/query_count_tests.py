@@ -0,0 +1,81 @@
+import json
+
+import sqlalchemy as sa
+
+from strichliste import middleware, models
+from strichliste.database import db
+
+from app_helpers import make_app
+
+USER_COUNT = 60
+MAX_STATEMENTS_PER_PAGE = 3
+
+
+def count_statements(app, func):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    sa.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return result, statements
+
+
+def test_user_list_statement_count():
+    app = make_app()
+    with app.app_context():
+        for x in range(USER_COUNT):
+            user = middleware.insert_user('user{}'.format(x))
+            if x % 3:
+                middleware.insert_transaction(user.id, 100 * (x % 5) - 150 or 50)
+        expected = [x.dict() for x in models.User.query.order_by(models.User.id)]
+
+    client = app.test_client()
+    for params in ({}, {'limit': 25, 'offset': 10}):
+        r, statements = count_statements(app, lambda: client.get('/user', query_string=params))
+        assert r.status_code == 200
+        assert len(statements) <= MAX_STATEMENTS_PER_PAGE
+        users = json.loads(r.get_data(as_text=True))
+        assert users['overallCount'] == USER_COUNT
+        offset = params.get('offset') or 0
+        limit = params.get('limit') or USER_COUNT
+        assert users['entries'] == expected[offset:offset + limit]
+
+
+def test_transaction_lists_skip_identity_map():
+    app = make_app()
+    with app.app_context():
+        user_id = middleware.insert_user('reader').id
+        for x in range(50):
+            middleware.insert_transaction(user_id, 10)
+        db.session.remove()
+        page = middleware.get_transactions()
+        assert len(page['entries']) == 50
+        assert len(db.session.identity_map) == 0
+        entries = middleware.get_user(user_id, transactions_limit=50)['transactions']
+        assert [x['id'] for x in entries] == [x['id'] for x in page['entries']]
+        assert len(db.session.identity_map) <= 1
+
+
+def test_batch_inserts_with_one_statement():
+    app = make_app()
+    with app.app_context():
+        user_ids = [middleware.insert_user('batch{}'.format(x)).id for x in range(2)]
+        middleware.insert_transaction(user_ids[0], 5)
+
+    client = app.test_client()
+    items = [{'userId': user_ids[x % 2], 'value': x + 1} for x in range(50)]
+    r, statements = count_statements(app, lambda: client.post('/transaction/batch', json={'transactions': items}))
+    assert r.status_code == 201
+    assert len([x for x in statements if x.startswith('INSERT INTO transactions')]) == 1
+    entries = json.loads(r.get_data(as_text=True))['entries']
+    assert [x['id'] for x in entries] == list(range(2, 52))
+    with app.app_context():
+        stored = [(x.id, x.userId, x.value) for x in models.Transaction.query.filter(models.Transaction.id > 1)]
+    assert stored == [(x['id'], x['userId'], x['value']) for x in entries]
@@ -0,0 +1,52 @@
+import datetime
+
+from strichliste import middleware, ranking
+from strichliste.database import db
+
+from app_helpers import make_app, write_config
+
+
+def test_ranking_follows_other_processes():
+    config_path = write_config()
+    app = make_app(config_path)
+    other = make_app(config_path)
+    with app.app_context():
+        for name in ('alice', 'bob', 'carol'):
+            middleware.insert_user(name)
+        middleware.insert_transaction(1, 500)
+        assert [x['id'] for x in middleware.get_ranking('balance', 2)] == [1, 2]
+        assert middleware.get_ranking('activity', 10, window=7) == [
+            {'rank': 1, 'id': 1, 'name': 'alice', 'balance': 500, 'countTransactions': 1}]
+
+    # written by another app with its own index, this app catches up by transaction id
+    with other.app_context():
+        middleware.insert_user('dave')
+        middleware.insert_transaction(4, -300)
+        middleware.insert_transaction(2, 100)
+        middleware.insert_transaction(2, 100)
+        db.session.remove()
+
+    with app.app_context():
+        middleware.insert_transaction(3, 50)
+        assert [(x['id'], x['balance']) for x in middleware.get_ranking('balance', 10)] == [
+            (1, 500), (2, 200), (3, 50), (4, -300)]
+        assert [x['id'] for x in middleware.get_ranking('balance', 1, descending=False)] == [4]
+        assert [(x['id'], x['countTransactions']) for x in middleware.get_ranking('activity', 10, window=1)] == [
+            (2, 2), (1, 1), (3, 1), (4, 1)]
+        assert app.extensions['ranking'].last_transaction_id == 5
+
+
+def test_activity_window_rolls_over():
+    index = ranking.RankingIndex()
+    index.today = datetime.date(2020, 1, 10)
+    index._add_user(1, 'alice', 0)
+    index._add_user(2, 'bob', 0)
+    index._apply(1, 1, 100, datetime.datetime(2020, 1, 4, 12))
+    index._apply(2, 1, 100, datetime.datetime(2020, 1, 10, 12))
+    index._apply(3, 2, 100, datetime.datetime(2020, 1, 10, 13))
+    index._apply(4, 2, 100, datetime.datetime(2020, 1, 10, 14))
+    assert index._activity(7) == [(-2, 1), (-2, 2)]
+    index._apply(5, 1, 100, datetime.datetime(2020, 1, 11, 9))
+    assert index.today == datetime.date(2020, 1, 11)
+    assert index._activity(7) == [(-2, 1), (-2, 2)]
+    assert index._activity(1) == [(-1, 1)]
@@ -0,0 +1,53 @@
+import pytest
+import sqlalchemy as sa
+
+from strichliste import middleware
+from strichliste.database import db
+
+from app_helpers import make_app
+
+
+def record_statements(engine):
+    statements = []
+    sa.event.listen(engine, 'before_cursor_execute',
+                    lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def make_routed_app(window_ms):
+    app = make_app(database={'journal_mode': 'WAL', 'read_only': 'yes', 'read_your_writes_ms': window_ms})
+    with app.app_context():
+        primary = record_statements(db.engine)
+    replica = record_statements(app.extensions['read_engine'])
+    return app, primary, replica
+
+
+def test_reads_use_read_only_engine():
+    app, primary, replica = make_routed_app(0)
+    client = app.test_client()
+    assert client.post('/user', json={'name': 'gert', 'mailAddress': ''}).status_code == 201
+    assert client.post('/user/1/transaction', json={'value': 100}).status_code == 201
+    assert primary and not replica
+
+    del primary[:]
+    for path in ('/user', '/user/1', '/user/1/transaction', '/transaction', '/metrics'):
+        assert client.get(path).status_code == 200
+    assert replica and not primary
+    assert client.get('/user/1').get_json()['balance'] == 100
+
+    with app.app_context():
+        with pytest.raises(sa.exc.OperationalError):
+            app.extensions['read_engine'].execute("DELETE FROM users")
+        assert middleware.get_user(1)['balance'] == 100
+
+
+def test_clients_read_their_writes_from_primary():
+    app, primary, replica = make_routed_app(60000)
+    client = app.test_client()
+    client.post('/user', json={'name': 'gert', 'mailAddress': ''})
+    del primary[:]
+    assert client.get('/user/1').status_code == 200
+    assert primary and not replica
+    other = app.test_client()
+    assert other.get('/user/1', environ_base={'REMOTE_ADDR': '10.0.0.2'}).status_code == 200
+    assert replica
@@ -0,0 +1,27 @@
+import json
+
+from strichliste import middleware, models
+from strichliste.database import db
+
+from app_helpers import make_app
+
+
+def test_reconcile_fix_changes_versions():
+    app = make_app(cache={'enabled': 'yes'})
+    client = app.test_client()
+    client.post('/user', json={'name': 'alice', 'mailAddress': ''})
+    client.post('/user/1/transaction', json={'value': 500})
+    r = client.get('/user/1')
+    etag = r.headers['ETag']
+    assert json.loads(r.data)['balance'] == 500
+    assert json.loads(client.get('/user').data)['entries'][0]['balance'] == 500
+
+    with app.app_context():
+        models.User.query.filter(models.User.id == 1).update({models.User.balance: 0})
+        db.session.commit()
+        assert middleware.reconcile_balances(fix=True) == [{'userId': 1, 'stored': 0, 'ledger': 500}]
+
+    r = client.get('/user/1', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert json.loads(r.data)['balance'] == 500
+    assert json.loads(client.get('/user').data)['entries'][0]['balance'] == 500
@@ -396,3 +396,236 @@ def test_25_metrics():
     assert current_day['overallNumber'] == 3
     assert current_day['distinctUsers'] == 2
 
+
+def test_26_load_transactions_after_cursor():
+    r = requests.get(''.join(URL + ('transaction',)), headers=HEADERS, params={'after_id': 1, 'limit': 1})
+    assert r.status_code == 200
+    assert r.headers['Content-Type'] == 'application/json'
+    transactions = json.loads(r.text)
+    assert {'overallCount', 'limit', 'offset', 'nextCursor', 'entries'}.issubset(transactions)
+    assert transactions['overallCount'] is None
+    assert transactions['limit'] == 1
+    assert len(transactions['entries']) == 1
+    assert transactions['entries'][0]['id'] == 2
+    assert transactions['nextCursor'] == 2
+
+    r = requests.get(''.join(URL + ('transaction',)), headers=HEADERS,
+                     params={'after_id': transactions['nextCursor'], 'limit': 2, 'count': 'true'})
+    transactions = json.loads(r.text)
+    assert transactions['overallCount'] == 3
+    assert [x['id'] for x in transactions['entries']] == [3]
+    assert transactions['nextCursor'] is None
+
+
+def test_27_load_user_transactions_before_cursor():
+    r = requests.get(''.join(URL + ('user', '/', '1', '/', 'transaction',)),
+                     headers=HEADERS,
+                     params={'before_id': 3, 'limit': 1})
+    assert r.status_code == 200
+    assert r.headers['Content-Type'] == 'application/json'
+    transactions = json.loads(r.text)
+    assert transactions['overallCount'] is None
+    entries = transactions['entries']
+    assert len(entries) == 1
+    assert entries[0]['id'] == 2
+    assert entries[0]['userId'] == 1
+    assert transactions['nextCursor'] == 2
+
+
+def test_28_metrics_days():
+    r = requests.get(''.join(URL + ('metrics',)),
+                     headers=HEADERS,
+                     params={'days': 30})
+    assert r.status_code == 200
+    assert r.headers['Content-Type'] == 'application/json'
+    metrics = json.loads(r.text)
+    assert len(metrics['days']) == 30
+    assert metrics['days'][-1]['date'] == datetime.datetime.utcnow().date().isoformat()
+    assert metrics['days'][-1]['dayBalancePositive'] == 2301
+    assert metrics['days'][-1]['dayBalanceNegative'] == -1000
+    assert metrics['days'][0]['overallNumber'] == 0
+
+
+def test_29_cached_user_invalidated_by_transaction():
+    r = requests.get(''.join(URL + ('user', '/', '2')), headers=HEADERS)
+    assert json.loads(r.text)['balance'] == -1000
+    params = {'value': 500}
+    r = requests.post(''.join((URL + ('user', '/', '2', '/', 'transaction',))),
+                      headers=HEADERS,
+                      data=json.dumps(params))
+    assert r.status_code == 201
+    r = requests.get(''.join(URL + ('user', '/', '2')), headers=HEADERS)
+    assert json.loads(r.text)['balance'] == -500
+
+    r = requests.get(''.join(URL + ('internal', '/', 'cache')), headers=HEADERS)
+    assert r.status_code == 200
+    stats = json.loads(r.text)
+    assert {'hits', 'misses', 'entries', 'size'}.issubset(stats)
+    assert stats['invalidations'] >= 1
+
+
+def test_30_conditional_get():
+    r = requests.get(''.join(URL + ('user', '/', '1')), headers=HEADERS)
+    assert r.status_code == 200
+    etag = r.headers['ETag']
+    r = requests.get(''.join(URL + ('user', '/', '1')), headers=dict(HEADERS, **{'If-None-Match': etag}))
+    assert r.status_code == 304
+    assert r.text == ''
+    r = requests.get(''.join(URL + ('user',)), headers=HEADERS)
+    users_etag = r.headers['ETag']
+
+    params = {'value': -100}
+    r = requests.post(''.join((URL + ('user', '/', '1', '/', 'transaction',))),
+                      headers=HEADERS,
+                      data=json.dumps(params))
+    assert r.status_code == 201
+    r = requests.get(''.join(URL + ('user', '/', '1')), headers=dict(HEADERS, **{'If-None-Match': etag}))
+    assert r.status_code == 200
+    assert r.headers['ETag'] != etag
+    assert json.loads(r.text)['balance'] == 2201
+    r = requests.get(''.join(URL + ('user',)), headers=dict(HEADERS, **{'If-None-Match': users_etag}))
+    assert r.status_code == 200
+
+
+def test_31_create_transaction_batch_rejected():
+    params = {'transactions': [{'userId': 2, 'value': 1000},
+                               {'userId': 2, 'value': -3000},
+                               {'userId': 10, 'value': 100},
+                               {'userId': 1, 'value': 0}]}
+    r = requests.post(''.join(URL + ('transaction', '/', 'batch')), headers=HEADERS, data=json.dumps(params))
+    assert r.status_code == 400
+    assert r.headers['Content-Type'] == 'application/json'
+    result = json.loads(r.text)
+    assert [x['code'] for x in result['results']] == ['ok', 'accountLow', 'userNotFound', 'valueZero']
+    assert [x['status'] for x in result['results']] == [200, 403, 404, 400]
+    assert result['results'][1]['message'] == ("transaction value of -3000 leads to an overall account balance "
+                                               "of -2500 which goes below the lower account limit of -2300")
+    r = requests.get(''.join(URL + ('user', '/', '2')), headers=HEADERS)
+    assert json.loads(r.text)['balance'] == -500
+
+
+def test_32_create_transaction_batch():
+    params = {'transactions': [{'userId': 2, 'value': 1000},
+                               {'userId': 2, 'value': -2500},
+                               {'userId': 1, 'value': -201}]}
+    r = requests.post(''.join(URL + ('transaction', '/', 'batch')), headers=HEADERS, data=json.dumps(params))
+    assert r.status_code == 201
+    assert r.headers['Content-Type'] == 'application/json'
+    entries = json.loads(r.text)['entries']
+    assert [x['id'] for x in entries] == [6, 7, 8]
+    assert [x['value'] for x in entries] == [1000, -2500, -201]
+    r = requests.get(''.join(URL + ('user', '/', '2')), headers=HEADERS)
+    assert json.loads(r.text)['balance'] == -2000
+    r = requests.get(''.join(URL + ('metrics',)), headers=HEADERS)
+    metrics = json.loads(r.text)
+    assert metrics['countTransactions'] == 8
+    assert metrics['overallBalance'] == 0
+    assert metrics['days'][-1]['distinctUsers'] == 2
+
+
+def test_33_transaction_stream():
+    r = requests.get(''.join(URL + ('transaction', '/', 'stream')), stream=True, timeout=10)
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('text/event-stream')
+    # the dev server does not chunk responses, read byte by byte so lines are not held back in a buffer
+    lines = r.iter_lines(chunk_size=1, decode_unicode=True)
+    assert next(lines).startswith('retry:')
+
+    params = {'value': 201}
+    requests.post(''.join((URL + ('user', '/', '1', '/', 'transaction',))),
+                  headers=HEADERS,
+                  data=json.dumps(params))
+    event = {}
+    for line in lines:
+        if not line:
+            if 'data' in event:
+                break
+            continue
+        key, value = line.split(': ', 1)
+        event[key] = value
+    r.close()
+    assert event['event'] == 'transaction'
+    assert event['id'] == '9'
+    data = json.loads(event['data'])
+    assert data['transaction']['id'] == 9
+    assert data['transaction']['value'] == 201
+    assert data['overallBalance'] == 201
+    assert data['countTransactions'] == 9
+
+
+def test_34_export_transactions():
+    r = requests.get(''.join(URL + ('transaction', '/', 'export')))
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('application/x-ndjson')
+    rows = [json.loads(x) for x in r.text.splitlines()]
+    assert [x['id'] for x in rows] == list(range(1, 10))
+    assert sum(x['value'] for x in rows) == 201
+
+    r = requests.get(''.join(URL + ('transaction', '/', 'export')), params={'format': 'csv', 'userId': 2})
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('text/csv')
+    lines = r.text.splitlines()
+    assert lines[0] == 'id,userId,value,createDate'
+    assert all(x.split(',')[1] == '2' for x in lines[1:])
+    r = requests.get(''.join(URL + ('user', '/', '2', '/', 'transaction')))
+    assert [int(x.split(',')[0]) for x in lines[1:]] == [x['id'] for x in json.loads(r.text)['entries']]
+
+    today = datetime.datetime.utcnow().date()
+    r = requests.get(''.join(URL + ('transaction', '/', 'export')),
+                     params={'from': (today + datetime.timedelta(days=1)).isoformat()})
+    assert r.status_code == 200
+    assert r.text == ''
+    r = requests.get(''.join(URL + ('transaction', '/', 'export')), params={'userId': 99})
+    assert r.status_code == 404
+
+
+def test_35_load_user_with_transactions_limit():
+    r = requests.get(''.join(URL + ('user', '/', '1')), params={'transactions_limit': 2})
+    assert r.status_code == 200
+    user = json.loads(r.text)
+    r = requests.get(''.join(URL + ('user', '/', '1', '/', 'transaction')))
+    entries = json.loads(r.text)['entries']
+    assert user['countTransactions'] == len(entries)
+    assert [x['id'] for x in user['transactions']] == [x['id'] for x in entries[-2:]]
+    assert user['lastTransaction'] == entries[-1]['createDate']
+
+    r = requests.get(''.join(URL + ('user', '/', '1')), params={'transactions_limit': 0})
+    user = json.loads(r.text)
+    assert user['transactions'] == []
+    assert user['lastTransaction'] == entries[-1]['createDate']
+    r = requests.get(''.join(URL + ('user', '/', '1')), params={'transactions_limit': -1})
+    assert r.status_code == 400
+
+
+def test_36_user_ranking():
+    users = json.loads(requests.get(''.join(URL + ('user',))).text)['entries']
+    r = requests.get(''.join(URL + ('user', '/', 'ranking')), params={'by': 'balance', 'limit': 3})
+    assert r.status_code == 200
+    ranking = json.loads(r.text)
+    expected = sorted(users, key=lambda x: (-x['balance'], x['id']))[:3]
+    assert [(x['id'], x['balance']) for x in ranking['entries']] == [(x['id'], x['balance']) for x in expected]
+    assert [x['rank'] for x in ranking['entries']] == list(range(1, len(expected) + 1))
+
+    r = requests.get(''.join(URL + ('user', '/', 'ranking')), params={'by': 'activity', 'window': 1, 'limit': 100})
+    before = {x['id']: x['countTransactions'] for x in json.loads(r.text)['entries']}
+    r = requests.post(''.join(URL + ('user', '/', '2', '/', 'transaction')), headers=HEADERS,
+                      data=json.dumps({'value': 1}))
+    assert r.status_code == 201
+    r = requests.get(''.join(URL + ('user', '/', 'ranking')), params={'by': 'activity', 'window': 1, 'limit': 100})
+    after = json.loads(r.text)['entries']
+    assert {x['id']: x['countTransactions'] for x in after}[2] == before.get(2, 0) + 1
+    counts = [x['countTransactions'] for x in after]
+    assert counts == sorted(counts, reverse=True)
+
+    r = requests.get(''.join(URL + ('user', '/', 'ranking')), params={'by': 'activity', 'window': 0})
+    assert r.status_code == 400
+    r = requests.get(''.join(URL + ('user', '/', 'ranking')), params={'by': 'name'})
+    assert r.status_code == 400
+
+
+def test_37_cursor_directions_can_not_be_combined():
+    params = {'limit': 2, 'after_id': 1, 'before_id': 5}
+    r = requests.get(''.join(URL + ('transaction',)), params=params)
+    assert r.status_code == 400
+    r = requests.get(''.join(URL + ('user', '/', '1', '/', 'transaction')), params=params)
+    assert r.status_code == 400